@@ -1,31 +1,193 @@
 import time
 import random
-import pandas as pd
 import json
 import re
-from selenium import webdriver
-from selenium.webdriver.common.by import By
-from selenium.webdriver.support.ui import WebDriverWait
-from selenium.webdriver.support import expected_conditions as EC
-from selenium.webdriver.edge.service import Service
-from selenium.webdriver.edge.options import Options
-from selenium.common.exceptions import TimeoutException, NoSuchElementException
-from webdriver_manager.microsoft import EdgeChromiumDriverManager
-from urllib.parse import urlparse
+import os
+import sys
+import csv
+import argparse
+import itertools
+import threading
+import queue
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import closing
+from abc import ABC, abstractmethod
+from collections import OrderedDict, Counter, deque
+from urllib.parse import urlparse, parse_qs, urlencode
+from html.parser import HTMLParser
 
 class XiaohongshuSeleniumCrawler:
-    def __init__(self, headless=False):
+    # 评论节点裁剪脚本：采集已滚出视口上方的评论节点文本后将其移除，
+    # 并用占位元素补足被移除的高度，保证滚动高度不变、站点分页触发照常工作
+    PRUNE_SCRIPT = """
+    const container = arguments[0];
+    const keep = arguments[1];
+    const unitSelector = '.parent-comment, [class*="comment-item"]';
+    const itemSelector = '[class*="comment-item"]';
+    const replySelector = '[class*="reply-container"], [class*="sub-comment"]';
+    const isPage = container === document.body || container === document.documentElement;
+    const viewTop = isPage ? 0 : container.getBoundingClientRect().top;
+
+    const units = Array.from(container.querySelectorAll(unitSelector)).filter(el => {
+        const outer = el.parentElement && el.parentElement.closest(unitSelector);
+        return !(outer && container.contains(outer));
+    });
+
+    const harvested = [];
+    const byParent = new Map();
+    for (const unit of units) {
+        if (unit.getBoundingClientRect().bottom >= viewTop - keep) {
+            break;
+        }
+        const items = unit.matches(itemSelector)
+            ? [unit].concat(Array.from(unit.querySelectorAll(itemSelector)))
+            : Array.from(unit.querySelectorAll(itemSelector));
+        if (!items.length) {
+            items.push(unit);
+        }
+        const parentId = (items[0].id || '').replace(/^comment-/, '');
+        for (const item of items) {
+            const id = (item.id || '').replace(/^comment-/, '');
+            const inReply = item !== items[0] && item.parentElement &&
+                item.parentElement.closest(replySelector);
+            harvested.push({
+                id: id,
+                text: item.innerText || '',
+                level: inReply ? 2 : 1,
+                parent_id: inReply ? parentId : ''
+            });
+        }
+        const parent = unit.parentElement;
+        if (!byParent.has(parent)) {
+            byParent.set(parent, []);
+        }
+        byParent.get(parent).push(unit);
+    }
+
+    for (const [parent, removed] of byParent) {
+        let spacer = parent.querySelector(':scope > [data-xhs-spacer]');
+        if (!spacer) {
+            spacer = document.createElement('div');
+            spacer.setAttribute('data-xhs-spacer', '1');
+            spacer.style.overflowAnchor = 'none';
+            parent.insertBefore(spacer, parent.firstChild);
+        }
+        const before = parent.getBoundingClientRect().height;
+        removed.forEach(el => el.remove());
+        const after = parent.getBoundingClientRect().height;
+        const current = parseFloat(spacer.style.height) || 0;
+        spacer.style.height = (current + before - after) + 'px';
+    }
+    return harvested;
+    """
+
+    # 采集页面中尚未从状态数据或裁剪过程中获得的评论节点，
+    # 已知id的节点不回传文本，无id的节点全部回传由Python端按内容去重
+    DOM_COMMENTS_SCRIPT = """
+    const known = new Set(arguments[0]);
+    const unitSelector = '.parent-comment, [class*="comment-item"]';
+    const itemSelector = '[class*="comment-item"]';
+    const replySelector = '[class*="reply-container"], [class*="sub-comment"]';
+
+    const items = [];
+    let covered = 0;
+    for (const item of document.querySelectorAll(itemSelector)) {
+        const id = (item.id || '').replace(/^comment-/, '');
+        if (id && known.has(id)) {
+            covered++;
+            continue;
+        }
+        const reply = item.parentElement && item.parentElement.closest(replySelector);
+        const unit = reply && reply.closest(unitSelector);
+        const parent = unit && (unit.matches(itemSelector) ? unit : unit.querySelector(itemSelector));
+        items.push({
+            id: id,
+            text: item.innerText || '',
+            level: reply ? 2 : 1,
+            parent_id: reply && parent ? (parent.id || '').replace(/^comment-/, '') : ''
+        });
+    }
+    return {items: items, covered: covered};
+    """
+
+    # 从页面状态中读取笔记的评论总数
+    COMMENT_COUNT_SCRIPT = """
+    try {
+        const detailMap = window.__INITIAL_STATE__.note.noteDetailMap;
+        const detail = detailMap[arguments[0]] || Object.values(detailMap)[0];
+        return String(detail.note.interactInfo.commentCount);
+    } catch (e) {
+        return null;
+    }
+    """
+    
+    # 登录状态探测脚本：侧边栏中指向个人主页的入口只在登录后出现；
+    # web_session游客也会下发，只有登录后值发生变化才能作为登录依据
+    SESSION_PROBE_SCRIPT = """
+    const cookie = document.cookie.split(';').map(c => c.trim()).find(c => c.startsWith('web_session='));
+    return {
+        url: location.href,
+        web_session: cookie ? cookie.slice('web_session='.length) : '',
+        has_user_marker: !!document.querySelector(
+            '.side-bar a[href*="/user/profile/"], li.user.side-bar-component a[href*="/user/profile/"]'
+        ),
+        has_login_modal: !!document.querySelector('.login-container, .login-modal, [class*="login-modal"]')
+    };
+    """
+    
+    # 导出文件的列顺序
+    COLUMNS = [
+        'comment_id', 'content', 'level', 'parent_id', 
+        'user_id', 'nickname', 'create_time', 'like_count',
+        'ip_location', 'at_users', 'sub_comment_count', 'avatar'
+    ]
+    
+    USER_AGENT = "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36 Edg/120.0.0.0"
+
+    def __init__(self, headless=False, prune_dom=False, interactive=True, freshness_cache=None,
+                 snapshot_dir=None, start_browser=True, profile_dir=None):
         """
         初始化Selenium爬虫
         :param headless: 是否使用无头模式
+        :param prune_dom: 是否在滚动加载时采集并裁剪已滚出视口的评论节点（评论很多时可保持页面轻量）
+        :param interactive: 是否允许通过input()等待用户操作，批量爬取时应设为False
+        :param freshness_cache: FreshnessCache实例，最近爬取过的笔记将直接跳过
+        :param snapshot_dir: 保存页面快照的目录，便于之后重新解析
+        :param start_browser: 是否启动浏览器，只解析已保存的数据时设为False
+        :param profile_dir: 浏览器用户数据目录，指定后登录状态在重启浏览器后仍然保留
         """
         self.comments_data = []
-        self.setup_driver(headless)
+        self.stats = CommentStats()
+        # 批量爬取时由调度器设置，跨笔记累计统计
+        self.batch_stats = None
+        self.interactive = interactive
+        # 等待和用户输入可替换，离线回放时跳过
+        self.sleep = time.sleep
+        self.prompt = input
+        self.freshness_cache = freshness_cache
+        self.last_cache_entry = None
+        self._logged_in_session = None
+        self._guest_web_session = None
+        self.prune_dom = prune_dom
+        self.pruned_count = 0
+        self._harvested_ids = set()
+        self.snapshot_dir = snapshot_dir
+        # 快照在滚动结束后保存，裁剪过的评论节点不会出现在快照中
+        if prune_dom and snapshot_dir:
+            print("⚠️  保存页面快照时不裁剪评论节点，以保证快照包含全部评论")
+            self.prune_dom = False
+        if start_browser:
+            self.setup_driver(headless, profile_dir)
         
-    def setup_driver(self, headless=False):
+    def setup_driver(self, headless=False, profile_dir=None):
         """
         设置Microsoft Edge浏览器驱动
         """
+        from selenium import webdriver
+        from selenium.webdriver.edge.service import Service
+        from selenium.webdriver.edge.options import Options
+        from webdriver_manager.microsoft import EdgeChromiumDriverManager
+        
         edge_options = Options()
         
         # 基本配置
@@ -36,8 +198,7 @@ class XiaohongshuSeleniumCrawler:
         edge_options.add_experimental_option('useAutomationExtension', False)
         
         # 设置用户代理
-        user_agent = "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36 Edg/120.0.0.0"
-        edge_options.add_argument(f'--user-agent={user_agent}')
+        edge_options.add_argument(f'--user-agent={self.USER_AGENT}')
         
         # 允许图片加载（登录需要验证码）
         prefs = {
@@ -50,6 +211,10 @@ class XiaohongshuSeleniumCrawler:
         
         if headless:
             edge_options.add_argument('--headless')
+        
+        # 使用独立的用户数据目录保存登录状态
+        if profile_dir:
+            edge_options.add_argument(f'--user-data-dir={os.path.abspath(profile_dir)}')
             
         # 设置窗口大小
         edge_options.add_argument('--window-size=1920,1080')
@@ -68,7 +233,34 @@ class XiaohongshuSeleniumCrawler:
             print("请确保已安装Microsoft Edge浏览器")
             raise
     
-    def extract_note_id(self, url):
+    def store_comment(self, comment):
+        """
+        保存一条评论并更新统计
+        """
+        self.comments_data.append(comment)
+        self.stats.add(comment)
+        if self.batch_stats is not None:
+            self.batch_stats.add(comment)
+    
+    def record_loaded(self, count):
+        """
+        记录滚动过程中新加载到页面上的评论数量，用于实时统计采集速度
+        """
+        self.stats.record_loaded(count)
+        if self.batch_stats is not None:
+            self.batch_stats.record_loaded(count)
+    
+    def reset_comments(self):
+        """
+        清空已采集的评论，开始爬取新的笔记
+        """
+        self.comments_data = []
+        self.stats = CommentStats()
+        self.pruned_count = 0
+        self._harvested_ids = set()
+    
+    @staticmethod
+    def extract_note_id(url):
         """
         从URL中提取笔记ID
         """
@@ -90,12 +282,15 @@ class XiaohongshuSeleniumCrawler:
         """
         等待页面加载完成
         """
+        from selenium.webdriver.support.ui import WebDriverWait
+        from selenium.common.exceptions import TimeoutException
+        
         try:
             WebDriverWait(self.driver, timeout).until(
                 lambda driver: driver.execute_script("return document.readyState") == "complete"
             )
             # 额外等待一下，确保动态内容加载
-            time.sleep(2)
+            self.sleep(2)
             return True
         except TimeoutException:
             print("页面加载超时")
@@ -105,12 +300,15 @@ class XiaohongshuSeleniumCrawler:
         """
         模拟人类行为
         """
+        from selenium import webdriver
+        from selenium.webdriver.common.by import By
+        
         # 随机滚动
         scroll_height = random.randint(100, 500)
         self.driver.execute_script(f"window.scrollBy(0, {scroll_height});")
         
         # 随机等待
-        time.sleep(random.uniform(1, 3))
+        self.sleep(random.uniform(1, 3))
         
         # 随机鼠标移动
         try:
@@ -119,55 +317,70 @@ class XiaohongshuSeleniumCrawler:
         except:
             pass
     
+    def probe_session_state(self):
+        """
+        通过一次脚本调用读取登录状态：侧边栏用户入口、认证Cookie和登录弹窗
+        未登录时记录游客的web_session，之后该Cookie发生变化也视为已登录；
+        尚未记录到非空的游客Cookie时只依据侧边栏用户入口判断
+        """
+        state = self.driver.execute_script(self.SESSION_PROBE_SCRIPT)
+        url = state.get('url', '').lower()
+        state['on_login_page'] = 'login' in url or 'signin' in url
+        
+        session_id = self.driver.session_id
+        web_session = state.get('web_session') or ''
+        guest = self._guest_web_session
+        if guest is not None and guest[0] != session_id:
+            guest = self._guest_web_session = None
+        cookie_changed = bool(web_session) and guest is not None and web_session != guest[1]
+        
+        state['logged_in'] = (
+            not state['on_login_page'] and
+            not state.get('has_login_modal') and
+            bool(state.get('has_user_marker') or cookie_changed)
+        )
+        if not state['logged_in'] and guest is None and web_session:
+            self._guest_web_session = (session_id, web_session)
+        return state
+    
+    def wait_for_session_state(self, timeout=3):
+        """
+        页面渲染完成前登录入口可能还未出现，短时间内轮询登录状态
+        """
+        interval = 0.3
+        polls = max(1, int(round(timeout / interval)))
+        for i in range(polls):
+            state = self.probe_session_state()
+            if state['logged_in'] or state['on_login_page'] or state.get('has_login_modal') or i == polls - 1:
+                return state
+            self.sleep(interval)
+    
     def login_check_and_wait(self):
         """
         检查登录状态，如果需要登录则等待用户手动登录
+        同一浏览器会话确认登录后不再重复检查
         """
+        from selenium.webdriver.common.by import By
+        
+        if self._logged_in_session is not None and self._logged_in_session == self.driver.session_id:
+            print("✅ 当前浏览器会话已登录")
+            return
+        
         print("\n=== 登录检查 ===")
         print("正在检查登录状态...")
         
         max_attempts = 3
         for attempt in range(max_attempts):
             try:
-                # 等待页面完全加载
-                time.sleep(3)
-                
-                # 检查URL是否包含登录相关路径
-                current_url = self.driver.current_url.lower()
-                if 'login' in current_url or 'signin' in current_url:
+                state = self.wait_for_session_state()
+                if state['on_login_page']:
                     print("⚠️  当前在登录页面")
-                    needs_login = True
-                else:
-                    # 检查页面是否能正常显示评论区域
-                    page_source = self.driver.page_source
-                    
-                    # 更准确的登录检测
-                    login_indicators = [
-                        "立即登录",
-                        "请先登录",
-                        "login-button",
-                        "登录后查看",
-                        "需要登录",
-                        "sign-in"
-                    ]
-                    
-                    # 检查是否存在用户信息或评论区域
-                    logged_in_indicators = [
-                        "用户头像",
-                        "个人中心",
-                        "我的",
-                        "comment",
-                        "评论",
-                        "user-info",
-                        "profile"
-                    ]
-                    
-                    has_login_prompt = any(indicator in page_source for indicator in login_indicators)
-                    has_user_content = any(indicator in page_source for indicator in logged_in_indicators)
-                    
-                    needs_login = has_login_prompt and not has_user_content
                 
-                if needs_login:
+                if not state['logged_in']:
+                    if not self.interactive:
+                        print("⚠️  检测到需要登录，非交互模式下无法等待登录，继续尝试爬取...")
+                        return
+                    
                     if attempt == 0:
                         print("⚠️  检测到需要登录")
                         print("🔧 已启用图片显示，验证码应该可以正常显示")
@@ -178,41 +391,29 @@ class XiaohongshuSeleniumCrawler:
                         print("3. 输入手机号和验证码")
                         print("4. 完成登录后，请按Enter继续...")
                         
-                        # 尝试自动跳转到登录页面
-                        try:
-                            login_buttons = self.driver.find_elements(By.XPATH, "//*[contains(text(), '登录') or contains(text(), 'Login')]")
-                            if login_buttons:
-                                for button in login_buttons:
-                                    if button.is_displayed() and button.is_enabled():
-                                        button.click()
-                                        print("已自动点击登录按钮")
-                                        time.sleep(2)
-                                        break
-                        except:
-                            pass
+                        # 尝试自动跳转到登录页面（已弹出登录框时无需再点击）
+                        if not state.get('has_login_modal'):
+                            try:
+                                login_buttons = self.driver.find_elements(By.XPATH, "//*[contains(text(), '登录') or contains(text(), 'Login')]")
+                                if login_buttons:
+                                    for button in login_buttons:
+                                        if button.is_displayed() and button.is_enabled():
+                                            button.click()
+                                            print("已自动点击登录按钮")
+                                            self.sleep(2)
+                                            break
+                            except:
+                                pass
                         
-                        input("登录完成后，请按Enter键继续...")
+                        self.prompt("登录完成后，请按Enter键继续...")
                     else:
                         print(f"第{attempt + 1}次检查登录状态...")
-                        input("如果已登录，请按Enter继续；否则请完成登录后再按Enter...")
+                        self.prompt("如果已登录，请按Enter继续；否则请完成登录后再按Enter...")
                     
                     # 重新检查登录状态
-                    time.sleep(2)
-                    current_url = self.driver.current_url.lower()
-                    page_source = self.driver.page_source
-                    
-                    # 更宽松的登录成功检测
-                    success_indicators = [
-                        "个人中心",
-                        "我的收藏",
-                        "用户",
-                        "avatar",
-                        "profile",
-                        not any(indicator in page_source for indicator in login_indicators)
-                    ]
-                    
-                    if 'login' not in current_url and any(success_indicators):
+                    if self.wait_for_session_state()['logged_in']:
                         print("✅ 登录状态验证成功")
+                        self._logged_in_session = self.driver.session_id
                         return
                     elif attempt < max_attempts - 1:
                         print("⚠️  登录状态仍需确认，请再次检查...")
@@ -221,12 +422,13 @@ class XiaohongshuSeleniumCrawler:
                         return
                 else:
                     print("✅ 检测到已登录状态")
+                    self._logged_in_session = self.driver.session_id
                     return
                     
             except Exception as e:
                 print(f"登录检查出错: {e}")
                 if attempt < max_attempts - 1:
-                    time.sleep(2)
+                    self.sleep(2)
                 else:
                     print("跳过登录检查，继续执行...")
                     return
@@ -235,6 +437,8 @@ class XiaohongshuSeleniumCrawler:
         """
         滚动到评论区域
         """
+        from selenium.webdriver.common.by import By
+        
         print("正在定位评论区域...")
         
         # 尝试多种方式定位评论区
@@ -259,29 +463,19 @@ class XiaohongshuSeleniumCrawler:
         
         if comment_section:
             self.driver.execute_script("arguments[0].scrollIntoView(true);", comment_section)
-            time.sleep(2)
+            self.sleep(2)
             print("已定位到评论区域")
         else:
             # 如果找不到评论区，尝试滚动到页面中部
             self.driver.execute_script("window.scrollTo(0, document.body.scrollHeight/2);")
-            time.sleep(2)
+            self.sleep(2)
             print("滚动到页面中部，寻找评论区域")
     
-    def load_more_comments(self, target_count=1083):
+    def locate_container_by_user_scroll(self, comment_container_selectors):
         """
-        通过滚动和点击"加载更多"来获取更多评论
+        让用户在评论区手动滚动，根据滚动位置的变化定位评论容器
         """
-        print(f"开始加载评论，目标数量: {target_count}")
-        
-        # 尝试定位评论区容器
-        comment_container_selectors = [
-            'div[role="dialog"] div.content-container',  # 评论弹窗内容区
-            'div[class*="comment-list"]',
-            'div.comment-list-container',
-            'div[class*="comments-container"]',
-            'div.xg-comments',
-            'div[class*="feed-comment"]'
-        ]
+        from selenium.webdriver.common.by import By
         
         # 获取滚动前所有可能容器的滚动位置
         scroll_positions = {}
@@ -289,7 +483,7 @@ class XiaohongshuSeleniumCrawler:
         print("1. 找到评论区域")
         print("2. 用鼠标滚轮在评论区域滚动一下")
         print("3. 按Enter键继续...")
-        input()
+        self.prompt()
         
         # 记录所有可能容器当前的滚动位置
         for selector in comment_container_selectors:
@@ -307,8 +501,8 @@ class XiaohongshuSeleniumCrawler:
         
         print("请再次在评论区域滚动一下")
         print("按Enter键继续...")
-        input()
-        time.sleep(1)  # 等待滚动完成
+        self.prompt()
+        self.sleep(1)  # 等待滚动完成
         
         # 检查哪个容器的滚动位置发生了变化
         comment_container = None
@@ -323,6 +517,31 @@ class XiaohongshuSeleniumCrawler:
             except:
                 continue
         
+        return comment_container
+    
+    def load_more_comments(self, target_count=1083):
+        """
+        通过滚动和点击"加载更多"来获取更多评论
+        """
+        from selenium.webdriver.common.by import By
+        
+        print(f"开始加载评论，目标数量: {target_count}")
+        
+        # 尝试定位评论区容器
+        comment_container_selectors = [
+            'div[role="dialog"] div.content-container',  # 评论弹窗内容区
+            'div[class*="comment-list"]',
+            'div.comment-list-container',
+            'div[class*="comments-container"]',
+            'div.xg-comments',
+            'div[class*="feed-comment"]'
+        ]
+        
+        # 交互模式下由用户手动滚动评论区来定位容器
+        comment_container = None
+        if self.interactive:
+            comment_container = self.locate_container_by_user_scroll(comment_container_selectors)
+        
         if not comment_container:
             print("未检测到评论容器的滚动，尝试其他方法...")
             # 尝试查找带有滚动条的元素
@@ -347,82 +566,129 @@ class XiaohongshuSeleniumCrawler:
         
         if not comment_container:
             print("无法找到评论容器，将在整个页面范围内滚动")
-            comment_container = self.driver.find_element(By.TAG_NAME, "body")
+            # 标准模式下页面滚动位置在documentElement上，body的scrollTop始终为0
+            comment_container = self.driver.execute_script("return document.scrollingElement || document.body;")
+            if not comment_container:
+                comment_container = self.driver.find_element(By.TAG_NAME, "body")
         
         loaded_count = 0
-        scroll_attempts = 0
-        max_scroll_attempts = 100
-        last_height = 0
+        error_count = 0
+        self.pruned_count = 0
+        self._harvested_ids = set()
+        
+        metrics_script = "return [arguments[0].scrollTop, arguments[0].scrollHeight, arguments[0].clientHeight];"
+        _, _, client_height = self.driver.execute_script(metrics_script, comment_container)
+        # 滚动次数上限只作为安全保护，正常情况下由产出率决定何时停止
+        controller = AdaptiveScrollController(client_height, max_scrolls=max(100, target_count * 3))
         
         print("\n开始自动滚动加载更多评论...")
         
-        while loaded_count < target_count and scroll_attempts < max_scroll_attempts:
+        while loaded_count < target_count:
             try:
-                # 获取当前滚动位置
-                current_position = self.driver.execute_script("return arguments[0].scrollTop;", comment_container)
-                total_height = self.driver.execute_script("return arguments[0].scrollHeight;", comment_container)
+                # 一次脚本调用获取滚动位置、总高度和可见高度
+                current_position, total_height, client_height = self.driver.execute_script(metrics_script, comment_container)
                 
-                # 计算新的滚动位置 (每次滚动一屏的1/3)
-                client_height = self.driver.execute_script("return arguments[0].clientHeight;", comment_container)
-                scroll_amount = max(client_height // 3, 100)  # 至少滚动100像素
-                new_position = min(current_position + scroll_amount, total_height)
+                # 由控制器决定滚动距离（发现底部加载时直接滚到底部）
+                new_position = controller.next_position(current_position, total_height)
+                # 读取实际滚动到的位置，容器不可滚动时位置不会变化
+                new_position = self.driver.execute_script(
+                    "arguments[0].scrollTop = arguments[1]; return arguments[0].scrollTop;", comment_container, new_position
+                )
+                grew, waited = self.wait_for_height_change(comment_container, total_height, controller.next_wait())
+                moved = new_position > current_position + 1
+                at_bottom = new_position >= total_height - client_height - 2
                 
-                # 执行滚动
-                self.driver.execute_script("arguments[0].scrollTop = arguments[1];", comment_container, new_position)
-                time.sleep(random.uniform(1, 1.5))
+                # 在最底部且没有新内容时尝试点击加载更多
+                if at_bottom and not grew and controller.idle >= 1:
+                    if self.click_load_more_button(comment_container):
+                        grew, waited = self.wait_for_height_change(comment_container, total_height, controller.next_wait())
                 
-                # 在最底部时尝试点击加载更多
-                if new_position >= total_height - client_height:
-                    button_clicked = self.click_load_more_button(comment_container)
-                    if button_clicked:
-                        time.sleep(random.uniform(1.5, 2))
-                        scroll_attempts = 0
-                        continue
+                # 统计当前已加载的评论数量（包括已裁剪的节点）
+                current_comments = self.count_visible_comments() + self.pruned_count
+                new_comments = max(current_comments - loaded_count, 0)
+                if new_comments:
+                    loaded_count = current_comments
+                    self.record_loaded(new_comments)
+                    print(f"当前已加载评论数量: {loaded_count}（{self.stats.comments_per_minute():.1f} 条/分钟）")
+                controller.observe(new_comments, grew, at_bottom, waited, moved)
                 
-                # 检查是否有新内容加载
-                new_height = self.driver.execute_script("return arguments[0].scrollHeight;", comment_container)
+                # 采集并裁剪已滚出视口的评论节点
+                if self.prune_dom:
+                    self.prune_harvested_comments(comment_container, client_height)
                 
-                if new_height == last_height:
-                    scroll_attempts += 1
-                    if scroll_attempts > 10:
-                        # 滚动到顶部再到底部，尝试触发加载
-                        self.driver.execute_script("arguments[0].scrollTop = 0;", comment_container)
-                        time.sleep(0.8)
-                        self.driver.execute_script(
-                            "arguments[0].scrollTop = arguments[0].scrollHeight;", 
-                            comment_container
-                        )
-                        time.sleep(0.8)
-                        
-                        # 再次检查高度
-                        final_height = self.driver.execute_script("return arguments[0].scrollHeight;", comment_container)
-                        if final_height == new_height:
-                            print("\n评论容器高度未变化，可能已加载完所有评论")
-                            break
-                else:
-                    scroll_attempts = 0
-                    last_height = new_height
+                stop_reason = controller.should_stop()
+                if stop_reason:
+                    print(f"\n{stop_reason}")
+                    break
                 
-                # 统计当前已加载的评论数量
-                current_comments = self.count_visible_comments()
-                if current_comments > loaded_count:
-                    loaded_count = current_comments
-                    print(f"当前已加载评论数量: {loaded_count}")
+                if controller.needs_nudge():
+                    # 滚动到顶部再到底部，尝试触发加载
+                    controller.nudged = True
+                    self.driver.execute_script("arguments[0].scrollTop = 0;", comment_container)
+                    self.sleep(controller.min_wait)
+                    self.driver.execute_script("arguments[0].scrollTop = arguments[0].scrollHeight;", comment_container)
+                    self.wait_for_height_change(comment_container, total_height, controller.next_wait())
+                
+                error_count = 0
                 
             except Exception as e:
                 print(f"滚动过程出错: {e}")
-                scroll_attempts += 1
-                if scroll_attempts > 10:
+                error_count += 1
+                if error_count > 10:
                     break
-                time.sleep(random.uniform(1, 2))
+                self.sleep(random.uniform(1, 2))
                 continue
         
+        print(f"共滚动 {controller.scrolls} 次，平均每条评论 {controller.scrolls_per_comment():.2f} 次滚动")
         print(f"\n评论加载完成，最终加载数量: {loaded_count}")
         
+    def wait_for_height_change(self, container, old_height, timeout):
+        """
+        滚动后轮询容器高度，高度变化（新内容加载）时立即返回
+        :return: (高度是否变化, 等待的时间)
+        """
+        interval = 0.25
+        polls = max(1, int(round(timeout / interval)))
+        for i in range(polls):
+            self.sleep(interval)
+            if self.driver.execute_script("return arguments[0].scrollHeight;", container) != old_height:
+                return True, (i + 1) * interval
+        return False, polls * interval
+    
+    def prune_harvested_comments(self, container, keep_px=0):
+        """
+        采集已滚出视口上方的评论节点并从DOM中移除，只保留等高的占位元素
+        :param container: 评论滚动容器
+        :param keep_px: 视口上方额外保留的像素高度
+        :return: 本次裁剪的评论数量
+        """
+        try:
+            harvested = self.driver.execute_script(self.PRUNE_SCRIPT, container, keep_px)
+        except Exception as e:
+            print(f"裁剪评论节点出错: {e}")
+            return 0
+        
+        if not harvested:
+            return 0
+        
+        for item in harvested:
+            comment_data = self.parse_comment_item(item, self.pruned_count)
+            self.pruned_count += 1
+            if not comment_data:
+                continue
+            
+            if item.get('id'):
+                self._harvested_ids.add(item['id'])
+            self.store_comment(comment_data)
+        
+        return len(harvested)
+    
     def click_load_more_button(self, container):
         """
         在指定容器中查找并点击加载更多按钮
         """
+        from selenium.webdriver.common.by import By
+        
         load_more_buttons = [
             "加载更多",
             "查看更多",
@@ -445,7 +711,7 @@ class XiaohongshuSeleniumCrawler:
                         except:
                             self.driver.execute_script("arguments[0].click();", button)
                         print(f"点击了'{button_text}'按钮")
-                        time.sleep(random.uniform(1.5, 3))
+                        self.sleep(random.uniform(1.5, 3))
                         return True
             except Exception as e:
                 continue
@@ -456,6 +722,8 @@ class XiaohongshuSeleniumCrawler:
         """
         统计当前页面可见的评论数量
         """
+        from selenium.webdriver.common.by import By
+        
         comment_selectors = [
             '[class*="comment-item"]',
             '[class*="CommentItem"]',
@@ -477,80 +745,145 @@ class XiaohongshuSeleniumCrawler:
     
     def extract_comments_from_page(self):
         """
-        从页面中提取评论数据
+        从页面中提取评论数据：页面状态中的结构化评论优先，
+        DOM中只解析状态数据和裁剪过程都未覆盖的评论节点
         """
         print("开始提取评论数据...")
         
-        # 尝试从页面的JavaScript变量中获取数据
+        state_comments = []
         try:
-            # 更安全的JavaScript执行方式
-            script_result = None
-            
-            # 分步骤执行，避免复杂的JavaScript导致错误
-            try:
-                # 首先检查是否存在常见的数据对象
-                has_initial_state = self.driver.execute_script("return typeof window.__INITIAL_STATE__ !== 'undefined';")
-                if has_initial_state:
-                    script_result = self.driver.execute_script("return window.__INITIAL_STATE__;")
-            except:
-                pass
-            
-            if not script_result:
-                try:
-                    has_apollo_state = self.driver.execute_script("return typeof window.__APOLLO_STATE__ !== 'undefined';")
-                    if has_apollo_state:
-                        script_result = self.driver.execute_script("return window.__APOLLO_STATE__;")
-                except:
-                    pass
-            
-            if not script_result:
-                try:
-                    has_next_data = self.driver.execute_script("return typeof window.__NEXT_DATA__ !== 'undefined';")
-                    if has_next_data:
-                        script_result = self.driver.execute_script("return window.__NEXT_DATA__;")
-                except:
-                    pass
-            
+            script_result = self.read_page_state()
             if script_result:
                 print("从页面JavaScript数据中提取评论...")
-                comments = self.parse_comments_from_js_data(script_result)
-                if comments:
-                    self.comments_data.extend(comments)
-                    print(f"从JavaScript数据中提取到 {len(comments)} 条评论")
-                    return
-                  
+                state_comments = self.parse_comments_from_js_data(script_result)
         except Exception as e:
             print(f"从JavaScript数据提取失败: {e}")
         
-        # 如果JavaScript方法失败，尝试DOM解析
-        self.extract_comments_from_dom()
+        known_ids = set(self._harvested_ids)
+        known_ids.update(str(c['comment_id']) for c in state_comments if c['comment_id'])
+        
+        dom_result = None
+        try:
+            dom_result = self.driver.execute_script(self.DOM_COMMENTS_SCRIPT, sorted(known_ids))
+        except Exception as e:
+            print(f"读取评论节点出错: {e}")
+        
+        items = dom_result['items'] if dom_result else []
+        state_comments, dom_comments = self.reconcile_comments(state_comments, items, len(self.comments_data))
+        
+        if not state_comments and not dom_comments and not (dom_result and dom_result['covered']):
+            # 页面中既没有状态数据也没有可识别的评论节点，使用启发式DOM解析
+            self.extract_comments_from_dom()
+            return
+        
+        # 滚动裁剪时按文本解析的评论，用状态数据中的结构化记录替换
+        harvested_index = {
+            str(c['comment_id']): i for i, c in enumerate(self.comments_data)
+            if str(c['comment_id']) in self._harvested_ids
+        }
+        replaced = 0
+        for comment in state_comments:
+            index = harvested_index.get(str(comment['comment_id']))
+            if index is None:
+                self.store_comment(comment)
+                continue
+            harvested = self.comments_data[index]
+            # 状态数据中缺少层级信息时保留DOM结构中得到的回复关系
+            if harvested['level'] == 2 and not comment['parent_id']:
+                comment['level'] = 2
+                comment['parent_id'] = harvested['parent_id']
+            self.comments_data[index] = comment
+            replaced += 1
+        for comment in dom_comments:
+            self.store_comment(comment)
+        
+        print(f"JS状态: {len(state_comments)} 条（其中替换滚动中采集的评论 {replaced} 条）, DOM补充: {len(dom_comments)} 条"
+              f"（已覆盖的评论节点 {dom_result['covered'] if dom_result else 0} 个）")
+    
+    def read_page_state(self):
+        """
+        读取页面内嵌的状态数据（__INITIAL_STATE__ / __APOLLO_STATE__ / __NEXT_DATA__）
+        """
+        for name in ('__INITIAL_STATE__', '__APOLLO_STATE__', '__NEXT_DATA__'):
+            try:
+                if self.driver.execute_script(f"return typeof window.{name} !== 'undefined';"):
+                    state = self.driver.execute_script(f"return window.{name};")
+                    if state:
+                        return state
+            except Exception:
+                continue
+        return None
+    
+    def reconcile_comments(self, state_comments, items, start_index=0):
+        """
+        合并页面状态中的评论和DOM评论节点
+        :param state_comments: 从状态数据中解析的评论
+        :param items: 页面中采集的评论节点 {id, text, level, parent_id}
+        :param start_index: DOM评论的起始序号
+        :return: (状态数据中的评论, 需要从DOM补充的评论)
+                 状态数据中的评论可能包含滚动裁剪时已采集的评论，由调用方替换
+        """
+        seen_ids = set()
+        merged = []
+        for comment in state_comments:
+            comment_id = str(comment['comment_id']) if comment['comment_id'] else ''
+            if comment_id:
+                if comment_id in seen_ids:
+                    continue
+                seen_ids.add(comment_id)
+            merged.append(comment)
+        
+        # 裁剪时已采集的节点不再从DOM解析，没有id的节点按评论内容匹配状态数据
+        seen_ids.update(self._harvested_ids)
+        known_contents = {c['content'].strip() for c in merged}
+        dom_comments = []
+        for item in items:
+            if item.get('id'):
+                if item['id'] in seen_ids:
+                    continue
+                seen_ids.add(item['id'])
+            elif any(line.strip() in known_contents for line in (item.get('text') or '').split("\n")):
+                continue
+            
+            comment_data = self.parse_comment_item(item, start_index + len(dom_comments))
+            if comment_data:
+                dom_comments.append(comment_data)
+        
+        return merged, dom_comments
     
     def parse_comments_from_js_data(self, data):
         """
-        从JavaScript数据中解析评论
+        从JavaScript数据中解析评论，同一id的评论只返回一次
         """
         comments = []
+        seen_ids = set()
         
         def find_comments_recursive(obj, depth=0):
             if depth > 10:  # 防止无限递归
                 return
             
             if isinstance(obj, dict):
-                # 查找评论相关的键
-                comment_keys = ['comments', 'comment', 'commentList', 'data']
+                # 查找评论相关的键（小红书笔记详情中评论位于 comments.list）
+                comment_keys = ['comments', 'comment', 'commentList', 'data', 'list']
+                walked = set()
                 for key in comment_keys:
                     if key in obj and isinstance(obj[key], (list, dict)):
                         if isinstance(obj[key], list):
                             for item in obj[key]:
                                 comment = self.parse_single_comment_from_js(item)
                                 if comment:
+                                    comment_id = str(comment['comment_id']) if comment['comment_id'] else ''
+                                    if comment_id and comment_id in seen_ids:
+                                        continue
+                                    seen_ids.add(comment_id)
                                     comments.append(comment)
                         else:
                             find_comments_recursive(obj[key], depth + 1)
+                            walked.add(key)
                 
-                # 递归搜索所有值
-                for value in obj.values():
-                    if isinstance(value, (dict, list)):
+                # 递归搜索其余的值（已按评论键搜索过的对象不再重复搜索）
+                for key, value in obj.items():
+                    if key not in walked and isinstance(value, (dict, list)):
                         find_comments_recursive(value, depth + 1)
             
             elif isinstance(obj, list):
@@ -602,6 +935,8 @@ class XiaohongshuSeleniumCrawler:
         """
         从DOM中提取评论数据（备用方案）
         """
+        from selenium.webdriver.common.by import By
+        
         print("使用DOM解析方式提取评论...")
         
         # 更精确的评论选择器
@@ -679,7 +1014,7 @@ class XiaohongshuSeleniumCrawler:
             try:
                 comment_data = self.parse_comment_element(element, i)
                 if comment_data and comment_data['content']:
-                    self.comments_data.append(comment_data)
+                    self.store_comment(comment_data)
             except Exception as e:
                 print(f"解析第{i+1}个评论时出错: {e}")
                 continue
@@ -692,7 +1027,31 @@ class XiaohongshuSeleniumCrawler:
         """
         try:
             # 获取评论文本
-            content = element.text.strip()
+            return self.parse_comment_text(element.text, index)
+        except Exception as e:
+            print(f"解析评论元素出错: {e}")
+            return None
+    
+    def parse_comment_item(self, item, index):
+        """
+        解析从页面中采集的评论节点 {id, text, level, parent_id}
+        """
+        comment_data = self.parse_comment_text(item.get('text') or '', index)
+        if not comment_data:
+            return None
+        
+        if item.get('id'):
+            comment_data['comment_id'] = item['id']
+        comment_data['level'] = item.get('level', 1)
+        comment_data['parent_id'] = item.get('parent_id', '')
+        return comment_data
+    
+    def parse_comment_text(self, content, index):
+        """
+        从评论元素的文本中解析评论数据
+        """
+        try:
+            content = content.strip()
             if not content:
                 return None
             
@@ -813,6 +1172,18 @@ class XiaohongshuSeleniumCrawler:
         主要的评论获取方法
         """
         try:
+            # 最近爬取过的笔记直接跳过，不再打开页面
+            self.last_cache_entry = None
+            if self.freshness_cache is not None:
+                entry = self.freshness_cache.lookup(url, count_probe=lambda: fetch_comment_count(url, self.get_cookie_header()))
+                if entry is not None:
+                    print(f"笔记 {entry['note_id']} 在 {int(time.time() - entry['crawled_at'])} 秒前已爬取，跳过")
+                    self.last_cache_entry = entry
+                    self.reset_comments()
+                    for comment in entry.get('comments') or []:
+                        self.store_comment(comment)
+                    return self.comments_data
+            
             print(f"正在访问页面: {url}")
             self.driver.get(url)
             
@@ -830,31 +1201,85 @@ class XiaohongshuSeleniumCrawler:
             # 加载更多评论
             self.load_more_comments(target_count)
             
+            # 保存页面快照
+            if self.snapshot_dir:
+                self.save_snapshot(url)
+            
             # 提取评论数据
             self.extract_comments_from_page()
             
+            if self.freshness_cache is not None and self.comments_data:
+                self.freshness_cache.put(url, self.comments_data, self.read_comment_count(url))
+            
             return self.comments_data
             
         except Exception as e:
             print(f"获取评论时出错: {e}")
             return []
     
-    def save_to_excel(self, filename="xiaohongshu_comments_selenium.xlsx"):
+    def save_snapshot(self, url):
+        """
+        保存当前页面的HTML和页面状态JSON，供之后离线重新解析
+        """
+        try:
+            os.makedirs(self.snapshot_dir, exist_ok=True)
+            base = os.path.join(self.snapshot_dir, f"{self.extract_note_id(url)}_{int(time.time())}")
+            
+            with open(base + ".html", 'w', encoding='utf-8') as f:
+                f.write(self.driver.page_source)
+            
+            state = self.driver.execute_script("""
+            try {
+                return JSON.stringify(window.__INITIAL_STATE__);
+            } catch (e) {
+                return null;
+            }
+            """)
+            if state:
+                with open(base + ".json", 'w', encoding='utf-8') as f:
+                    f.write(state)
+            
+            print(f"页面快照已保存到 {base}.html")
+        except Exception as e:
+            print(f"保存页面快照失败: {e}")
+    
+    def read_comment_count(self, url):
+        """
+        从当前页面状态中读取笔记的评论总数，读取失败返回None
+        """
+        try:
+            count = self.driver.execute_script(self.COMMENT_COUNT_SCRIPT, self.extract_note_id(url))
+            return int(count) if count is not None and str(count).isdigit() else None
+        except Exception:
+            return None
+    
+    def get_cookie_header(self):
+        """
+        将浏览器当前的Cookie转换为HTTP请求头格式
+        """
+        try:
+            return "; ".join(f"{c['name']}={c['value']}" for c in self.driver.get_cookies())
+        except Exception:
+            return ""
+    
+    def save_to_excel(self, filename="xiaohongshu_comments_selenium.xlsx", comments=None):
         """
         保存数据到Excel文件
+        :param comments: 要保存的评论列表，默认为当前采集的评论
         """
-        if not self.comments_data:
+        import pandas as pd
+        
+        if comments is None:
+            comments = self.comments_data
+        
+        if not comments:
             print("没有数据可保存")
             return
         
-        df = pd.DataFrame(self.comments_data)
+        df = pd.DataFrame(comments)
         
         # 重新排列列的顺序
-        columns_order = [
-            'comment_id', 'content', 'level', 'parent_id', 
-            'user_id', 'nickname', 'create_time', 'like_count',
-            'ip_location', 'at_users', 'sub_comment_count', 'avatar'
-        ]
+        columns_order = self.COLUMNS
         
         # 确保所有列都存在
         for col in columns_order:
@@ -868,11 +1293,12 @@ class XiaohongshuSeleniumCrawler:
         print(f"数据已保存到 {filename}")
         
         # 打印统计信息
-        level_1_count = len(df[df['level'] == 1])
-        level_2_count = len(df[df['level'] == 2])
-        print(f"一级评论: {level_1_count} 条")
-        print(f"二级评论: {level_2_count} 条")
-        print(f"总计: {len(df)} 条")
+        if comments is self.comments_data:
+            stats = self.stats
+        else:
+            stats = CommentStats()
+            stats.add_many(comments)
+        stats.report()
         
         # 显示部分数据预览
         print("\n数据预览:")
@@ -886,50 +1312,2102 @@ class XiaohongshuSeleniumCrawler:
             self.driver.quit()
             print("浏览器已关闭")
 
-def main():
+class AdaptiveScrollController:
     """
-    主函数
+    根据每次滚动新加载的评论数自适应调整滚动步长和等待时间
+    发现站点只在滚动到底部时加载（底部哨兵触发）后直接跳到底部，
+    底部持续没有新评论时根据评论产出率决定是否停止
     """
-    print("=== 小红书评论爬虫 (Selenium + Edge版本) ===")
-    print("此版本使用Microsoft Edge浏览器自动化技术，可以更好地应对反爬虫措施")
+    def __init__(self, client_height, min_wait=0.5, max_wait=4.0, min_yield=1.0, alpha=0.5,
+                 max_stalls=10, max_scrolls=3000):
+        """
+        :param client_height: 评论容器的可见高度
+        :param min_wait: 每次滚动后的最短等待时间（秒）
+        :param max_wait: 每次滚动后的最长等待时间（秒）
+        :param min_yield: 底部平均每次滚动新增的评论数低于此值时允许停止
+        :param alpha: 产出率和加载耗时的指数平滑系数
+        :param max_stalls: 滚动位置连续多少次没有前进且没有新评论时停止
+        :param max_scrolls: 滚动次数上限
+        """
+        self.min_step = 100
+        self.max_step = max(client_height * 2, self.min_step)
+        self.step = max(client_height // 3, self.min_step)
+        self.min_wait = min_wait
+        self.max_wait = max_wait
+        self.wait = min(max(1.2, min_wait), max_wait)
+        self.min_yield = min_yield
+        self.alpha = alpha
+        self.yield_rate = None
+        self.latency = None
+        self.sentinel = False
+        self.bottom_loads = 0
+        self.mid_loads = 0
+        self.idle = 0
+        self.nudged = False
+        self.max_stalls = max_stalls
+        self.stalls = 0
+        self.max_scrolls = max_scrolls
+        self.scrolls = 0
+        self.loaded = 0
     
-    # 输入参数
-    url = input("请输入小红书笔记URL: ").strip()
+    def _smooth(self, old, new):
+        return new if old is None else self.alpha * new + (1 - self.alpha) * old
     
-    # 询问是否使用无头模式
-    headless_choice = input("是否使用无头模式？(y/n，建议选择n以便观察和手动登录): ").strip().lower()
-    headless = headless_choice == 'y'
+    def next_position(self, top, height):
+        """
+        下一次滚动的目标位置
+        """
+        if self.sentinel:
+            return height
+        return min(top + self.step, height)
     
-    # 目标评论数量
-    try:
-        target_count = int(input("请输入目标评论数量 (默认1083): ").strip() or "1083")
-    except ValueError:
-        target_count = 1083
+    def next_wait(self):
+        """
+        下一次滚动后最多等待的时间
+        """
+        return self.wait * random.uniform(0.9, 1.1)
     
-    crawler = None
-    try:
-        # 初始化爬虫
-        crawler = XiaohongshuSeleniumCrawler(headless=headless)
+    def observe(self, new_comments, grew, at_bottom, waited, moved=True):
+        """
+        记录一次滚动的结果
+        :param new_comments: 本次滚动新增的评论数
+        :param grew: 容器高度是否增加
+        :param at_bottom: 本次滚动是否到达底部
+        :param waited: 滚动后到高度增加（或等待结束）的时间
+        :param moved: 滚动位置是否实际前进（容器不可滚动时始终为False）
+        """
+        self.scrolls += 1
+        self.loaded += new_comments
         
-        # 获取评论
-        print(f"\n开始爬取评论，目标数量: {target_count}")
-        comments = crawler.get_comments(url, target_count)
+        if new_comments or grew:
+            self.stalls = 0
+        elif not moved and not at_bottom:
+            self.stalls += 1
         
-        if comments:
-            # 保存到Excel
-            note_id = crawler.extract_note_id(url)
-            filename = f"xiaohongshu_comments_{note_id}_{int(time.time())}.xlsx"
-            crawler.save_to_excel(filename)
-            print(f"\n✅ 爬取完成！共获取 {len(comments)} 条评论")
+        if grew:
+            # 按实际加载耗时调整等待时间
+            self.latency = self._smooth(self.latency, waited)
+            self.wait = min(max(self.latency * 1.5, self.min_wait), self.max_wait)
+            if at_bottom:
+                self.bottom_loads += 1
+            else:
+                self.mid_loads += 1
+            if not self.sentinel and self.bottom_loads >= 2 and self.mid_loads == 0:
+                self.sentinel = True
+                print("检测到评论在滚动到底部时加载，之后直接滚动到底部")
+        
+        # 评论计数选择器失效时计数始终为0，底部容器高度增加同样视为有产出
+        progress = new_comments or (self.min_yield if grew and at_bottom else 0)
+        
+        # 在已加载的内容中间滚动没有新评论是正常的，不计入产出率
+        if at_bottom or progress:
+            self.yield_rate = self._smooth(self.yield_rate, progress)
+        
+        if progress:
+            self.idle = 0
+            self.nudged = False
+        elif at_bottom:
+            self.idle += 1
+            if not grew:
+                self.wait = min(self.wait * 1.5, self.max_wait)
         else:
-            print("\n❌ 未获取到评论数据")
-            
-    except Exception as e:
-        print(f"程序执行出错: {str(e)}")
-    finally:
-        if crawler:
-            input("\n按Enter键关闭浏览器...")
+            # 尚未到达底部，加大步长尽快越过已加载的内容
+            self.step = min(int(self.step * 1.5), self.max_step)
+    
+    def needs_nudge(self):
+        """
+        底部连续没有新评论时，尝试滚动到顶部再回到底部触发加载（每次停滞只尝试一次）
+        """
+        return self.idle >= 2 and not self.nudged
+    
+    def should_stop(self):
+        """
+        判断是否停止滚动，返回停止原因，不需要停止时返回None
+        尝试触发加载后底部仍没有新评论且产出率已降到阈值以下、
+        滚动位置持续不动或滚动次数达到上限时停止
+        """
+        if self.nudged and self.idle >= 2 and (self.yield_rate or 0) < self.min_yield:
+            return "底部持续没有新评论，可能已加载完所有评论"
+        if self.stalls >= self.max_stalls:
+            return f"滚动位置连续 {self.stalls} 次没有变化且没有新评论，停止滚动"
+        if self.scrolls >= self.max_scrolls:
+            return f"已达到滚动次数上限 {self.max_scrolls}，停止滚动"
+        return None
+    
+    def scrolls_per_comment(self):
+        return self.scrolls / self.loaded if self.loaded else float(self.scrolls)
+
+class CommentStats:
+    """
+    评论的流式统计，每条评论以O(1)代价更新，爬取过程中可随时读取
+    采集速度按滚动时加载的评论数和已解析的评论数中较大者计算，
+    未裁剪节点时评论在滚动结束后才解析，速度仍随滚动实时更新
+    """
+    def __init__(self, rate_window=60):
+        """
+        :param rate_window: 计算每分钟评论数的时间窗口（秒）
+        """
+        self.rate_window = rate_window
+        self.total = 0
+        self.loaded = 0
+        self._progress = 0
+        self.level_counts = Counter()
+        self.commenters = Counter()
+        self.locations = Counter()
+        self.like_histogram = Counter()
+        self.started_at = time.time()
+        self._recent = deque()
+        self._lock = threading.Lock()
+    
+    @staticmethod
+    def _to_int(value):
+        """
+        将点赞数、评论层级等字段转换为整数，支持"1.2万"这类写法
+        """
+        if isinstance(value, (int, float)):
+            return int(value)
+        text = str(value or '').strip()
+        try:
+            if text.endswith('万'):
+                return int(float(text[:-1]) * 10000)
+            return int(float(text)) if text else 0
+        except ValueError:
+            return 0
+    
+    @staticmethod
+    def _like_bucket(likes):
+        """
+        按数量级划分点赞区间：0、1-9、10-99、100-999 ...
+        """
+        if likes <= 0:
+            return "0"
+        digits = len(str(likes))
+        low = 10 ** (digits - 1)
+        return f"{low}-{low * 10 - 1}"
+    
+    def add(self, comment):
+        """
+        记录一条评论
+        """
+        now = time.time()
+        likes = self._to_int(comment.get('like_count'))
+        commenter = comment.get('nickname') or comment.get('user_id')
+        location = comment.get('ip_location')
+        
+        with self._lock:
+            self.total += 1
+            self.level_counts[self._to_int(comment.get('level')) or 1] += 1
+            self.like_histogram[self._like_bucket(likes)] += 1
+            if commenter:
+                self.commenters[commenter] += 1
+            if location:
+                self.locations[location] += 1
+            self._advance(now)
+    
+    def record_loaded(self, count):
+        """
+        记录滚动时新加载的评论数量（尚未解析）
+        """
+        with self._lock:
+            self.loaded += count
+            self._advance(time.time())
+    
+    def _advance(self, now):
+        """
+        更新采集进度，只有进度增加的部分计入速度（需持有锁）
+        """
+        progress = max(self.total, self.loaded)
+        if progress > self._progress:
+            self._recent.append((now, progress - self._progress))
+            self._progress = progress
+        while self._recent and self._recent[0][0] < now - self.rate_window:
+            self._recent.popleft()
+    
+    def add_many(self, comments):
+        """
+        记录多条评论
+        """
+        for comment in comments:
+            self.add(comment)
+    
+    def comments_per_minute(self):
+        """
+        最近时间窗口内的采集速度（条/分钟）
+        """
+        now = time.time()
+        with self._lock:
+            while self._recent and self._recent[0][0] < now - self.rate_window:
+                self._recent.popleft()
+            return sum(count for _, count in self._recent) * 60.0 / self.rate_window
+    
+    def snapshot(self, top_k=10):
+        """
+        返回当前统计结果
+        :param top_k: 评论最多的用户和地区各返回前几名
+        """
+        rate = self.comments_per_minute()
+        with self._lock:
+            elapsed = time.time() - self.started_at
+            return {
+                'total': self.total,
+                'loaded': self.loaded,
+                'levels': dict(self.level_counts),
+                'top_commenters': self.commenters.most_common(top_k),
+                'top_locations': self.locations.most_common(top_k),
+                'like_histogram': dict(sorted(self.like_histogram.items(), key=lambda item: self._to_int(item[0].split('-')[0]))),
+                'comments_per_minute': round(rate, 1),
+                'average_per_minute': round(self._progress * 60.0 / max(elapsed, 1.0), 1),
+                'elapsed': round(elapsed, 1)
+            }
+    
+    def report(self, top_k=5):
+        """
+        打印统计信息
+        """
+        stats = self.snapshot(top_k)
+        print(f"一级评论: {stats['levels'].get(1, 0)} 条")
+        print(f"二级评论: {stats['levels'].get(2, 0)} 条")
+        print(f"总计: {stats['total']} 条")
+        if stats['top_commenters']:
+            print("评论最多的用户: " + "，".join(f"{name}({count})" for name, count in stats['top_commenters']))
+        if stats['top_locations']:
+            print("评论最多的地区: " + "，".join(f"{name}({count})" for name, count in stats['top_locations']))
+        print("点赞分布: " + "，".join(f"{bucket}: {count}" for bucket, count in stats['like_histogram'].items()))
+        # 统计时长不足一个时间窗口时速度没有参考意义（如离线统计）
+        if stats['elapsed'] >= self.rate_window:
+            print(f"采集速度: 最近 {stats['comments_per_minute']} 条/分钟，平均 {stats['average_per_minute']} 条/分钟")
+
+def normalize_note_url(url):
+    """
+    将不同形式的笔记URL统一为 /explore/<笔记ID> 形式，保留访问所需的xsec参数
+    :return: (笔记ID, 规范化后的URL)
+    """
+    note_id = XiaohongshuSeleniumCrawler.extract_note_id(url)
+    query = parse_qs(urlparse(url).query)
+    params = {key: query[key][0] for key in ('xsec_token', 'xsec_source') if key in query}
+    normalized = f"https://www.xiaohongshu.com/explore/{note_id}"
+    if params:
+        normalized += "?" + urlencode(params)
+    return note_id, normalized
+
+def fetch_comment_count(url, cookie_header="", timeout=10):
+    """
+    不启动浏览器，直接请求笔记页面并从页面状态中读取评论总数，失败返回None
+    """
+    from urllib.request import Request, urlopen
+    
+    _, normalized = normalize_note_url(url)
+    headers = {'User-Agent': XiaohongshuSeleniumCrawler.USER_AGENT}
+    if cookie_header:
+        headers['Cookie'] = cookie_header
+    
+    try:
+        with urlopen(Request(normalized, headers=headers), timeout=timeout) as response:
+            html = response.read().decode('utf-8', errors='ignore')
+    except Exception as e:
+        print(f"读取评论数失败: {e}")
+        return None
+    
+    match = re.search(r'"commentCount"\s*:\s*"?(\d+)', html)
+    return int(match.group(1)) if match else None
+
+class FreshnessCache:
+    """
+    最近爬取笔记的缓存，按笔记ID去重，支持过期时间和LRU淘汰
+    可选地在缓存过期后比较评论总数，只有评论数变化时才重新爬取
+    """
+    def __init__(self, ttl=3600, max_entries=200, path=None, check_comment_count=False):
+        """
+        :param ttl: 缓存有效期（秒）
+        :param max_entries: 最多缓存的笔记数量，超出后淘汰最久未使用的笔记
+        :param path: 缓存文件路径，用于跨进程保留爬取记录（评论内容只保存在内存中）
+        :param check_comment_count: 缓存过期后是否先读取评论总数，未变化则继续跳过
+        """
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.path = path
+        self.check_comment_count = check_comment_count
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        
+        if path and os.path.exists(path):
+            try:
+                with open(path, 'r', encoding='utf-8') as f:
+                    for entry in json.load(f):
+                        self._entries[entry['note_id']] = entry
+            except Exception as e:
+                print(f"读取缓存文件失败: {e}")
+    
+    def lookup(self, url, count_probe=None):
+        """
+        查询笔记是否无需重新爬取，需要跳过时返回缓存记录，否则返回None
+        :param count_probe: 读取当前评论总数的函数，仅在缓存过期且开启评论数检查时调用
+        """
+        note_id, _ = normalize_note_url(url)
+        with self._lock:
+            entry = self._entries.get(note_id)
+            if entry is None:
+                return None
+            self._entries.move_to_end(note_id)
+            if time.time() - entry['crawled_at'] < self.ttl:
+                return entry
+        
+        if not self.check_comment_count or count_probe is None or entry.get('comment_count') is None:
+            return None
+        
+        # 缓存已过期，评论总数未变化时视为仍然新鲜
+        if count_probe() != entry['comment_count']:
+            return None
+        with self._lock:
+            entry['crawled_at'] = time.time()
+        self._save()
+        return entry
+    
+    def put(self, url, comments, comment_count=None):
+        """
+        记录一次成功的爬取
+        """
+        note_id, normalized = normalize_note_url(url)
+        with self._lock:
+            self._entries[note_id] = {
+                'note_id': note_id,
+                'url': normalized,
+                'crawled_at': time.time(),
+                'comment_count': comment_count,
+                'count': len(comments),
+                'comments': list(comments)
+            }
+            self._entries.move_to_end(note_id)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        self._save()
+    
+    def _save(self):
+        if not self.path:
+            return
+        with self._lock:
+            records = [
+                {key: value for key, value in entry.items() if key != 'comments'}
+                for entry in self._entries.values()
+            ]
+        try:
+            with open(self.path, 'w', encoding='utf-8') as f:
+                json.dump(records, f, ensure_ascii=False)
+        except Exception as e:
+            print(f"保存缓存文件失败: {e}")
+
+class HostRateLimiter:
+    """
+    按站点限速的请求预算（线程安全）
+    每个域名按固定间隔发放请求时间槽，同时受全局请求速率限制
+    """
+    def __init__(self, requests_per_minute=6, global_requests_per_minute=None, jitter=1.0):
+        """
+        :param requests_per_minute: 每个域名每分钟允许的请求数
+        :param global_requests_per_minute: 所有域名合计每分钟允许的请求数，默认不限制
+        :param jitter: 每个时间槽附加的随机延迟上限（秒）
+        """
+        self.interval = 60.0 / requests_per_minute
+        self.global_interval = 60.0 / global_requests_per_minute if global_requests_per_minute else 0
+        self.jitter = jitter
+        self._next_slot = {}
+        self._next_global_slot = 0
+        self._lock = threading.Lock()
+    
+    def reserve(self, url):
+        """
+        为一次请求预约时间槽，返回需要等待的秒数
+        """
+        host = urlparse(url).netloc.lower()
+        with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._next_slot.get(host, now), self._next_global_slot)
+            self._next_slot[host] = slot + self.interval + random.uniform(0, self.jitter)
+            self._next_global_slot = slot + self.global_interval
+            return slot - now
+    
+    def wait(self, url):
+        """
+        阻塞等待直到可以请求该URL
+        """
+        delay = self.reserve(url)
+        if delay > 0:
+            time.sleep(delay)
+    
+    async def acquire(self, url):
+        """
+        异步等待直到可以请求该URL
+        """
+        import asyncio
+        
+        delay = self.reserve(url)
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+class AsyncCrawlScheduler:
+    """
+    基于asyncio的批量爬取调度器
+    每个浏览器独占一个执行线程，笔记按优先级排队，
+    结果保存在后台进行，与下一篇笔记的页面加载重叠
+    """
+    def __init__(self, crawlers, rate_limiter=None, output_dir=".", target_count=1083, freshness_cache=None):
+        """
+        :param crawlers: XiaohongshuSeleniumCrawler实例列表，每个实例对应一个浏览器
+        :param rate_limiter: HostRateLimiter实例，默认每个域名每分钟6次请求
+        :param output_dir: Excel文件的保存目录
+        :param target_count: 默认的目标评论数量
+        :param freshness_cache: FreshnessCache实例，提交时跳过最近爬取过的笔记
+        """
+        self.crawlers = list(crawlers)
+        self.rate_limiter = rate_limiter or HostRateLimiter()
+        self.output_dir = output_dir
+        self.target_count = target_count
+        self.freshness_cache = freshness_cache
+        self.results = {}
+        # 整个批次的累计统计
+        self.stats = CommentStats()
+        for crawler in self.crawlers:
+            crawler.batch_stats = self.stats
+        self._note_ids = set()
+        self._pending = []
+        self._queue = None
+        self._seq = itertools.count()
+    
+    def submit(self, url, priority=0, target_count=None):
+        """
+        提交一篇笔记，priority越小越先爬取
+        同一笔记的不同URL形式只会爬取一次
+        """
+        note_id, url = normalize_note_url(url)
+        if note_id in self._note_ids:
+            return
+        self._note_ids.add(note_id)
+        
+        if self.freshness_cache is not None and self.freshness_cache.lookup(url) is not None:
+            self.results[url] = {'status': 'fresh'}
+            return
+        
+        item = (priority, next(self._seq), url, target_count or self.target_count)
+        self.results[url] = {'status': 'queued'}
+        if self._queue is not None:
+            self._queue.put_nowait(item)
+        else:
+            self._pending.append(item)
+    
+    async def run(self):
+        """
+        爬取所有已提交的笔记，返回 {url: 结果} 字典
+        """
+        import asyncio
+        
+        self._queue = asyncio.PriorityQueue()
+        for item in self._pending:
+            self._queue.put_nowait(item)
+        self._pending = []
+        
+        write_queue = asyncio.Queue()
+        executors = [
+            ThreadPoolExecutor(max_workers=1, thread_name_prefix=f"xhs-browser-{i}")
+            for i in range(len(self.crawlers))
+        ]
+        workers = [
+            asyncio.create_task(self._browser_worker(crawler, executor, write_queue))
+            for crawler, executor in zip(self.crawlers, executors)
+        ]
+        writer = asyncio.create_task(self._writer(write_queue))
+        
+        try:
+            await self._queue.join()
+            await write_queue.join()
+        finally:
+            for task in workers + [writer]:
+                task.cancel()
+            await asyncio.gather(*workers, writer, return_exceptions=True)
+            for executor in executors:
+                executor.shutdown(wait=True)
+            self._queue = None
+        
+        print("\n=== 批量爬取统计 ===")
+        self.stats.report()
+        return self.results
+    
+    async def _browser_worker(self, crawler, executor, write_queue):
+        """
+        从队列中取出笔记，在浏览器专属线程中爬取
+        """
+        import asyncio
+        
+        loop = asyncio.get_running_loop()
+        while True:
+            priority, _, url, target_count = await self._queue.get()
+            try:
+                await self.rate_limiter.acquire(url)
+                self.results[url] = {'status': 'running'}
+                started = time.monotonic()
+                comments = await loop.run_in_executor(executor, self._crawl_note, crawler, url, target_count)
+                if crawler.last_cache_entry is not None:
+                    self.results[url] = {'status': 'fresh', 'count': crawler.last_cache_entry['count']}
+                    continue
+                self.results[url] = {
+                    'status': 'done' if comments else 'empty',
+                    'count': len(comments),
+                    'elapsed': round(time.monotonic() - started, 1),
+                    'stats': crawler.stats.snapshot()
+                }
+                if comments:
+                    await write_queue.put((crawler, url, comments))
+            except Exception as e:
+                print(f"爬取 {url} 出错: {e}")
+                self.results[url] = {'status': 'failed', 'error': str(e)}
+            finally:
+                self._queue.task_done()
+    
+    def _crawl_note(self, crawler, url, target_count):
+        """
+        在浏览器线程中爬取单篇笔记
+        """
+        crawler.reset_comments()
+        return crawler.get_comments(url, target_count)
+    
+    async def _writer(self, write_queue):
+        """
+        在后台线程中保存爬取结果，不占用浏览器线程
+        """
+        import asyncio
+        
+        loop = asyncio.get_running_loop()
+        while True:
+            crawler, url, comments = await write_queue.get()
+            try:
+                filename = await loop.run_in_executor(None, self._save_result, crawler, url, comments)
+                self.results[url]['file'] = filename
+            except Exception as e:
+                print(f"保存 {url} 的结果出错: {e}")
+                self.results[url]['error'] = str(e)
+            finally:
+                write_queue.task_done()
+    
+    def _save_result(self, crawler, url, comments):
+        """
+        保存单篇笔记的评论到Excel文件
+        """
+        note_id = crawler.extract_note_id(url)
+        filename = os.path.join(self.output_dir, f"xiaohongshu_comments_{note_id}_{int(time.time())}.xlsx")
+        crawler.save_to_excel(filename, comments)
+        return filename
+
+class JobQueue(ABC):
+    """
+    笔记爬取任务队列接口
+    工作节点通过租约领取任务，爬取期间定期续约，完成后确认结果；
+    租约过期的任务会被重新分配，失败的任务按次数重试
+    """
+    @abstractmethod
+    def add(self, url, priority=0, target_count=1083, max_attempts=3):
+        """
+        添加任务，同一笔记只会入队一次，返回是否新增
+        """
+    
+    @abstractmethod
+    def lease(self, worker_id, lease_seconds=600):
+        """
+        领取一个任务，没有可领取的任务时返回None
+        """
+    
+    @abstractmethod
+    def heartbeat(self, job_id, worker_id, lease_seconds=600):
+        """
+        延长任务租约，租约已失效时返回False
+        """
+    
+    @abstractmethod
+    def ack(self, job_id, worker_id, result=None):
+        """
+        确认任务完成，租约已失效时返回False
+        """
+    
+    @abstractmethod
+    def fail(self, job_id, worker_id, error=""):
+        """
+        报告任务失败，未超过重试次数的任务会重新入队
+        """
+    
+    @abstractmethod
+    def counts(self):
+        """
+        返回各状态的任务数量
+        """
+
+class SQLiteJobQueue(JobQueue):
+    """
+    基于共享SQLite文件的任务队列
+    多台机器挂载同一路径即可共同消费一个爬取列表
+    """
+    SCHEMA = """
+    CREATE TABLE IF NOT EXISTS jobs (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        note_id TEXT NOT NULL UNIQUE,
+        url TEXT NOT NULL,
+        priority INTEGER NOT NULL DEFAULT 0,
+        target_count INTEGER NOT NULL DEFAULT 1083,
+        status TEXT NOT NULL DEFAULT 'pending',
+        attempts INTEGER NOT NULL DEFAULT 0,
+        max_attempts INTEGER NOT NULL DEFAULT 3,
+        lease_owner TEXT,
+        lease_expires REAL,
+        result TEXT,
+        error TEXT,
+        created_at REAL NOT NULL,
+        updated_at REAL NOT NULL
+    );
+    CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs (status, priority, id);
+    """
+    
+    def __init__(self, path, timeout=30):
+        """
+        :param path: SQLite数据库文件路径，可位于共享目录
+        :param timeout: 等待数据库锁的超时时间（秒）
+        """
+        self.path = path
+        self.timeout = timeout
+        with self._connect() as conn:
+            conn.executescript(self.SCHEMA)
+    
+    def _connect(self):
+        import sqlite3
+        
+        conn = sqlite3.connect(self.path, timeout=self.timeout, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        return closing(conn)
+    
+    def add(self, url, priority=0, target_count=1083, max_attempts=3):
+        note_id = XiaohongshuSeleniumCrawler.extract_note_id(url)
+        now = time.time()
+        with self._connect() as conn:
+            cursor = conn.execute(
+                "INSERT OR IGNORE INTO jobs (note_id, url, priority, target_count, max_attempts, created_at, updated_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (note_id, url, priority, target_count, max_attempts, now, now)
+            )
+            return cursor.rowcount == 1
+    
+    def lease(self, worker_id, lease_seconds=600):
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                # 回收已过期的租约（工作节点崩溃或失联）
+                conn.execute(
+                    "UPDATE jobs SET status = CASE WHEN attempts >= max_attempts THEN 'failed' ELSE 'pending' END, "
+                    "lease_owner = NULL, lease_expires = NULL, error = '租约过期', updated_at = ? "
+                    "WHERE status = 'leased' AND lease_expires < ?",
+                    (now, now)
+                )
+                row = conn.execute(
+                    "SELECT * FROM jobs WHERE status = 'pending' ORDER BY priority, id LIMIT 1"
+                ).fetchone()
+                if row is None:
+                    conn.execute("COMMIT")
+                    return None
+                
+                conn.execute(
+                    "UPDATE jobs SET status = 'leased', lease_owner = ?, lease_expires = ?, "
+                    "attempts = attempts + 1, updated_at = ? WHERE id = ?",
+                    (worker_id, now + lease_seconds, now, row['id'])
+                )
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+        
+        job = dict(row)
+        job.update(status='leased', lease_owner=worker_id, attempts=row['attempts'] + 1)
+        return job
+    
+    def heartbeat(self, job_id, worker_id, lease_seconds=600):
+        now = time.time()
+        with self._connect() as conn:
+            cursor = conn.execute(
+                "UPDATE jobs SET lease_expires = ?, updated_at = ? "
+                "WHERE id = ? AND lease_owner = ? AND status = 'leased'",
+                (now + lease_seconds, now, job_id, worker_id)
+            )
+            return cursor.rowcount == 1
+    
+    def ack(self, job_id, worker_id, result=None):
+        with self._connect() as conn:
+            cursor = conn.execute(
+                "UPDATE jobs SET status = 'done', result = ?, error = NULL, lease_expires = NULL, updated_at = ? "
+                "WHERE id = ? AND lease_owner = ? AND status = 'leased'",
+                (json.dumps(result, ensure_ascii=False), time.time(), job_id, worker_id)
+            )
+            return cursor.rowcount == 1
+    
+    def fail(self, job_id, worker_id, error=""):
+        with self._connect() as conn:
+            cursor = conn.execute(
+                "UPDATE jobs SET status = CASE WHEN attempts >= max_attempts THEN 'failed' ELSE 'pending' END, "
+                "lease_owner = NULL, lease_expires = NULL, error = ?, updated_at = ? "
+                "WHERE id = ? AND lease_owner = ? AND status = 'leased'",
+                (str(error), time.time(), job_id, worker_id)
+            )
+            return cursor.rowcount == 1
+    
+    def counts(self):
+        with self._connect() as conn:
+            rows = conn.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall()
+        return {status: count for status, count in rows}
+
+def run_queue_worker(job_queue, crawler, worker_id=None, output_dir=".", lease_seconds=600,
+                     heartbeat_interval=60, poll_interval=10, rate_limiter=None):
+    """
+    从共享任务队列中领取笔记并爬取，直到队列中没有未完成的任务
+    :param job_queue: JobQueue实例
+    :param crawler: 本机的XiaohongshuSeleniumCrawler实例（建议interactive=False）
+    :param worker_id: 工作节点标识，默认为 主机名-进程号
+    """
+    import socket
+    
+    worker_id = worker_id or f"{socket.gethostname()}-{os.getpid()}"
+    print(f"工作节点 {worker_id} 已启动")
+    processed = 0
+    
+    while True:
+        job = job_queue.lease(worker_id, lease_seconds)
+        if job is None:
+            counts = job_queue.counts()
+            if not counts.get('pending') and not counts.get('leased'):
+                break
+            # 其他节点的任务仍在进行，等待其完成或租约过期
+            time.sleep(poll_interval)
+            continue
+        
+        url = job['url']
+        print(f"\n领取任务 #{job['id']} (第{job['attempts']}次尝试): {url}")
+        
+        # 爬取期间定期续约
+        stop_heartbeat = threading.Event()
+        def keep_alive():
+            while not stop_heartbeat.wait(heartbeat_interval):
+                if not job_queue.heartbeat(job['id'], worker_id, lease_seconds):
+                    print(f"⚠️  任务 #{job['id']} 的租约已失效")
+                    return
+        heartbeat_thread = threading.Thread(target=keep_alive, daemon=True)
+        heartbeat_thread.start()
+        
+        try:
+            if rate_limiter:
+                rate_limiter.wait(url)
+            crawler.reset_comments()
+            comments = crawler.get_comments(url, job['target_count'])
+            stop_heartbeat.set()
+            
+            if crawler.last_cache_entry is not None:
+                job_queue.ack(job['id'], worker_id, {'count': crawler.last_cache_entry['count'], 'fresh': True, 'worker': worker_id})
+                print(f"任务 #{job['id']} 的笔记最近已爬取，跳过")
+            elif comments:
+                filename = os.path.join(output_dir, f"xiaohongshu_comments_{job['note_id']}_{int(time.time())}.xlsx")
+                crawler.save_to_excel(filename, comments)
+                if job_queue.ack(job['id'], worker_id, {'count': len(comments), 'file': filename, 'worker': worker_id}):
+                    print(f"✅ 任务 #{job['id']} 完成，共 {len(comments)} 条评论")
+                else:
+                    print(f"⚠️  任务 #{job['id']} 的租约已被回收，结果未确认")
+            else:
+                job_queue.fail(job['id'], worker_id, "未获取到评论数据")
+                print(f"❌ 任务 #{job['id']} 未获取到评论数据")
+        except Exception as e:
+            job_queue.fail(job['id'], worker_id, e)
+            print(f"❌ 任务 #{job['id']} 出错: {e}")
+        finally:
+            stop_heartbeat.set()
+            heartbeat_thread.join()
+        
+        processed += 1
+    
+    print(f"队列中没有待处理的任务，工作节点 {worker_id} 共处理 {processed} 个任务")
+    return processed
+
+class ReplayMismatchError(Exception):
+    """
+    回放时遇到录制中不存在的WebDriver命令
+    """
+
+class ReplayCommandError(Exception):
+    """
+    回放录制时出错的WebDriver命令
+    """
+
+class RecordingElement:
+    """
+    录制页面元素上的操作
+    """
+    def __init__(self, recorder, element, ref):
+        self._recorder = recorder
+        self._element = element
+        self.ref = ref
+    
+    @property
+    def text(self):
+        return self._recorder._call(self.ref, self._element, 'text')
+    
+    @property
+    def tag_name(self):
+        return self._recorder._call(self.ref, self._element, 'tag_name')
+    
+    def is_displayed(self):
+        return self._recorder._call(self.ref, self._element, 'is_displayed')
+    
+    def is_enabled(self):
+        return self._recorder._call(self.ref, self._element, 'is_enabled')
+    
+    def click(self):
+        return self._recorder._call(self.ref, self._element, 'click')
+    
+    def get_attribute(self, name):
+        return self._recorder._call(self.ref, self._element, 'get_attribute', name)
+    
+    def find_element(self, by, value):
+        return self._recorder._call(self.ref, self._element, 'find_element', by, value)
+    
+    def find_elements(self, by, value):
+        return self._recorder._call(self.ref, self._element, 'find_elements', by, value)
+
+class RecordingDriver:
+    """
+    WebDriver的录制包装器，把每条命令及其返回值写入JSONL文件
+    页面元素按首次出现的顺序编号，回放时由ReplayDriver按编号还原
+    """
+    def __init__(self, driver, log_path, meta=None):
+        self._driver = driver
+        self._file = open(log_path, 'w', encoding='utf-8')
+        self._refs = {}
+        self._next_ref = itertools.count(1)
+        self.session_id = driver.session_id
+        self._file.write(json.dumps({'meta': dict(meta or {}, session_id=self.session_id)}, ensure_ascii=False) + "\n")
+    
+    def _wrap(self, value):
+        if isinstance(value, RecordingElement):
+            return value
+        if hasattr(value, 'id') and hasattr(value, 'find_elements') and hasattr(value, 'is_displayed'):
+            if value.id not in self._refs:
+                self._refs[value.id] = RecordingElement(self, value, next(self._next_ref))
+            return self._refs[value.id]
+        if isinstance(value, list):
+            return [self._wrap(item) for item in value]
+        if isinstance(value, dict):
+            return {key: self._wrap(item) for key, item in value.items()}
+        return value
+    
+    def _unwrap(self, value):
+        if isinstance(value, RecordingElement):
+            return value._element
+        if isinstance(value, (list, tuple)):
+            return [self._unwrap(item) for item in value]
+        return value
+    
+    @staticmethod
+    def _serialize(value):
+        if isinstance(value, RecordingElement):
+            return {'__element__': value.ref}
+        if isinstance(value, (list, tuple)):
+            return [RecordingDriver._serialize(item) for item in value]
+        if isinstance(value, dict):
+            return {key: RecordingDriver._serialize(item) for key, item in value.items()}
+        return value
+    
+    def _call(self, target, obj, command, *args):
+        record = {'target': target, 'command': command, 'args': self._serialize(list(args))}
+        try:
+            attr = getattr(obj, command)
+            result = self._wrap(attr(*[self._unwrap(arg) for arg in args]) if callable(attr) else attr)
+        except Exception as e:
+            record['error'] = f"{type(e).__name__}: {e}"
+            self._file.write(json.dumps(record, ensure_ascii=False) + "\n")
+            raise
+        record['result'] = self._serialize(result)
+        self._file.write(json.dumps(record, ensure_ascii=False) + "\n")
+        return result
+    
+    @property
+    def current_url(self):
+        return self._call('driver', self._driver, 'current_url')
+    
+    @property
+    def page_source(self):
+        return self._call('driver', self._driver, 'page_source')
+    
+    def get(self, url):
+        return self._call('driver', self._driver, 'get', url)
+    
+    def execute_script(self, script, *args):
+        return self._call('driver', self._driver, 'execute_script', script, *args)
+    
+    def find_element(self, by, value):
+        return self._call('driver', self._driver, 'find_element', by, value)
+    
+    def find_elements(self, by, value):
+        return self._call('driver', self._driver, 'find_elements', by, value)
+    
+    def get_cookies(self):
+        return self._call('driver', self._driver, 'get_cookies')
+    
+    def close_log(self):
+        self._file.close()
+    
+    def quit(self):
+        self.close_log()
+        self._driver.quit()
+
+class ReplayElement:
+    """
+    回放时代表录制中的页面元素
+    """
+    def __init__(self, replayer, ref):
+        self._replayer = replayer
+        self.ref = ref
+    
+    @property
+    def text(self):
+        return self._replayer._respond(self.ref, 'text', ())
+    
+    @property
+    def tag_name(self):
+        return self._replayer._respond(self.ref, 'tag_name', ())
+    
+    def is_displayed(self):
+        return self._replayer._respond(self.ref, 'is_displayed', ())
+    
+    def is_enabled(self):
+        return self._replayer._respond(self.ref, 'is_enabled', ())
+    
+    def click(self):
+        return self._replayer._respond(self.ref, 'click', ())
+    
+    def get_attribute(self, name):
+        return self._replayer._respond(self.ref, 'get_attribute', (name,))
+    
+    def find_element(self, by, value):
+        return self._replayer._respond(self.ref, 'find_element', (by, value))
+    
+    def find_elements(self, by, value):
+        return self._replayer._respond(self.ref, 'find_elements', (by, value))
+
+class ReplayDriver:
+    """
+    按录制文件返回WebDriver命令的结果，不需要浏览器和网络
+    默认按 (目标, 命令, 脚本/选择器, 元素参数) 分组依次返回录制结果，
+    轮询次数不同时重复该组最后一次的结果；strict=True 时要求命令顺序与录制完全一致
+    爬虫会捕获大部分异常，不一致的命令除抛出ReplayMismatchError外还会记录在mismatches中
+    """
+    def __init__(self, log_path, strict=False):
+        self.strict = strict
+        self.call_counts = Counter()
+        self.misses = 0
+        self.mismatches = []
+        self._elements = {}
+        self._groups = {}
+        self._last = {}
+        self._sequence = deque()
+        
+        with open(log_path, 'r', encoding='utf-8') as f:
+            self.meta = json.loads(f.readline())['meta']
+            for line in f:
+                if line.strip():
+                    record = json.loads(line)
+                    self._sequence.append(record)
+                    key = self._key(record['target'], record['command'], record['args'])
+                    self._groups.setdefault(key, deque()).append(record)
+        self.session_id = self.meta.get('session_id')
+    
+    @staticmethod
+    def _key(target, command, args):
+        # 滚动位置等数值参数每次运行都可能不同，只用脚本、选择器和元素参数区分命令
+        parts = []
+        for arg in args:
+            if isinstance(arg, dict) and '__element__' in arg:
+                parts.append(f"element:{arg['__element__']}")
+            elif isinstance(arg, str):
+                parts.append(arg)
+        return json.dumps([target, command] + parts, ensure_ascii=False)
+    
+    def _serialize_args(self, args):
+        return [{'__element__': arg.ref} if isinstance(arg, ReplayElement) else arg for arg in args]
+    
+    def _materialize(self, value):
+        if isinstance(value, dict):
+            if set(value) == {'__element__'}:
+                ref = value['__element__']
+                if ref not in self._elements:
+                    self._elements[ref] = ReplayElement(self, ref)
+                return self._elements[ref]
+            return {key: self._materialize(item) for key, item in value.items()}
+        if isinstance(value, list):
+            return [self._materialize(item) for item in value]
+        return value
+    
+    def _respond(self, target, command, args):
+        self.call_counts[command] += 1
+        key = self._key(target, command, self._serialize_args(args))
+        
+        if self.strict:
+            record = self._sequence.popleft() if self._sequence else None
+            if record is None or self._key(record['target'], record['command'], record['args']) != key:
+                self.mismatches.append(key)
+                raise ReplayMismatchError(f"命令顺序与录制不一致: {key}")
+        else:
+            group = self._groups.get(key)
+            if group:
+                record = group.popleft()
+                self._last[key] = record
+            elif key in self._last:
+                record = self._last[key]
+                self.misses += 1
+            else:
+                self.mismatches.append(key)
+                raise ReplayMismatchError(f"录制中没有该命令: {key}")
+        
+        if 'error' in record:
+            raise ReplayCommandError(record['error'])
+        return self._materialize(record.get('result'))
+    
+    def unused(self):
+        """
+        录制中未被回放的命令数量
+        """
+        if self.strict:
+            return len(self._sequence)
+        return sum(len(group) for group in self._groups.values())
+    
+    @property
+    def current_url(self):
+        return self._respond('driver', 'current_url', ())
+    
+    @property
+    def page_source(self):
+        return self._respond('driver', 'page_source', ())
+    
+    def get(self, url):
+        return self._respond('driver', 'get', (url,))
+    
+    def execute_script(self, script, *args):
+        return self._respond('driver', 'execute_script', (script,) + args)
+    
+    def find_element(self, by, value):
+        return self._respond('driver', 'find_element', (by, value))
+    
+    def find_elements(self, by, value):
+        return self._respond('driver', 'find_elements', (by, value))
+    
+    def get_cookies(self):
+        return self._respond('driver', 'get_cookies', ())
+    
+    def quit(self):
+        pass
+
+def record_session(crawler, url, log_path, target_count=1083):
+    """
+    录制一次get_comments爬取过程中的全部WebDriver命令和返回值
+    :return: 爬取到的评论
+    """
+    # 固定随机种子，回放时等待时长（以及轮询次数）与录制时一致
+    seed = random.randrange(2 ** 32)
+    random.seed(seed)
+    meta = {
+        'url': url,
+        'target_count': target_count,
+        'interactive': crawler.interactive,
+        'prune_dom': crawler.prune_dom,
+        'seed': seed,
+        'recorded_at': time.time()
+    }
+    driver = crawler.driver
+    crawler.driver = RecordingDriver(driver, log_path, meta)
+    try:
+        return crawler.get_comments(url, target_count)
+    finally:
+        crawler.driver.close_log()
+        crawler.driver = driver
+        print(f"WebDriver会话已录制到 {log_path}")
+
+def replay_session(log_path, repeat=1, strict=False):
+    """
+    离线回放录制的会话，测量爬虫自身的Python耗时和WebDriver调用次数
+    回放时跳过所有等待和用户输入，可用于对比不同版本的性能
+    :return: 每次回放的统计结果列表
+    """
+    results = []
+    for _ in range(repeat):
+        driver = ReplayDriver(log_path, strict=strict)
+        meta = driver.meta
+        crawler = XiaohongshuSeleniumCrawler(
+            prune_dom=meta.get('prune_dom', False),
+            interactive=meta.get('interactive', False),
+            start_browser=False
+        )
+        crawler.driver = driver
+        crawler.sleep = lambda seconds: None
+        crawler.prompt = lambda message="": ""
+        random.seed(meta.get('seed', 0))
+        
+        wall_started = time.perf_counter()
+        cpu_started = time.process_time()
+        comments = crawler.get_comments(meta['url'], meta.get('target_count', 1083))
+        results.append({
+            'wall': time.perf_counter() - wall_started,
+            'cpu': time.process_time() - cpu_started,
+            'comments': len(comments),
+            'calls': sum(driver.call_counts.values()),
+            'calls_by_command': dict(driver.call_counts),
+            'misses': driver.misses,
+            'unused': driver.unused(),
+            'mismatches': len(driver.mismatches),
+            # 出现与录制不一致的命令时，爬取流程与录制不同，耗时不能用于版本对比
+            'valid': not driver.mismatches
+        })
+        if driver.mismatches:
+            print(f"⚠️  回放出现 {len(driver.mismatches)} 次与录制不一致的命令，第一条: {driver.mismatches[0]}")
+    
+    print("\n=== 回放结果 ===")
+    for i, result in enumerate(results, 1):
+        print(f"第{i}次: 用时 {result['wall'] * 1000:.1f} ms (CPU {result['cpu'] * 1000:.1f} ms)，"
+              f"评论 {result['comments']} 条，WebDriver调用 {result['calls']} 次，"
+              f"重复结果 {result['misses']} 次，未使用录制 {result['unused']} 条"
+              + ("" if result['valid'] else f"，❌ 不一致命令 {result['mismatches']} 次，结果无效"))
+    if results:
+        print("各命令调用次数: " + "，".join(f"{name}: {count}" for name, count in sorted(results[0]['calls_by_command'].items())))
+    return results
+
+def crawl_batch(urls, browsers=1, headless=False, requests_per_minute=6,
+                output_dir=".", target_count=1083, prune_dom=False, freshness_cache=None, profile_dir=None):
+    """
+    使用多个浏览器批量爬取多篇笔记的评论
+    每个浏览器启动后先打开首页完成一次登录检查，之后的爬取过程不再等待用户操作
+    :param urls: 笔记URL列表，按列表顺序确定优先级
+    :param browsers: 同时运行的浏览器数量
+    :param requests_per_minute: 每个域名每分钟允许打开的页面数
+    :param freshness_cache: FreshnessCache实例，跳过最近爬取过的笔记
+    :param profile_dir: 浏览器用户数据目录，每个浏览器使用其中一个子目录以保留登录状态
+    """
+    import asyncio
+    
+    crawlers = []
+    try:
+        for index in range(browsers):
+            crawler = XiaohongshuSeleniumCrawler(
+                headless=headless, prune_dom=prune_dom, interactive=True, freshness_cache=freshness_cache,
+                profile_dir=os.path.join(profile_dir, f"browser-{index}") if profile_dir else None
+            )
+            crawlers.append(crawler)
+            print(f"\n浏览器 {index + 1}/{browsers} 登录检查")
+            crawler.driver.get(CrawlDaemon.HOME_URL)
+            crawler.wait_for_page_load()
+            crawler.login_check_and_wait()
+            crawler.interactive = False
+        
+        scheduler = AsyncCrawlScheduler(
+            crawlers,
+            rate_limiter=HostRateLimiter(requests_per_minute),
+            output_dir=output_dir,
+            target_count=target_count,
+            freshness_cache=freshness_cache
+        )
+        for priority, url in enumerate(urls):
+            scheduler.submit(url, priority=priority)
+        
+        return asyncio.run(scheduler.run())
+    finally:
+        for crawler in crawlers:
+            crawler.close()
+
+class CrawlDaemon:
+    """
+    常驻爬取服务：维护一组已登录的浏览器，通过本地HTTP接口接收爬取任务
+    浏览器爬取一定数量的笔记或浏览器进程内存增长过多后自动重启
+    """
+    HOME_URL = "https://www.xiaohongshu.com/explore"
+    
+    def __init__(self, browsers=2, host="127.0.0.1", port=8765, headless=False, profile_dir="xhs_profiles",
+                 recycle_after=20, max_memory_growth_mb=512, requests_per_minute=6,
+                 target_count=1083, prune_dom=True, freshness_cache=None, max_finished_jobs=200,
+                 restart_attempts=5, restart_backoff=30):
+        """
+        :param browsers: 常驻浏览器数量
+        :param profile_dir: 浏览器用户数据目录，每个浏览器使用其中一个子目录以保留登录状态
+        :param recycle_after: 每个浏览器爬取多少篇笔记后重启
+        :param max_memory_growth_mb: 浏览器进程（含渲染进程）内存比启动时增长超过该值（MB）后重启浏览器，需要安装psutil
+        :param max_finished_jobs: 内存中最多保留多少个已结束任务的结果
+        :param restart_attempts: 浏览器重启失败时最多重试几次，之后该浏览器标记为不可用
+        :param restart_backoff: 第一次重试前等待的秒数，之后每次翻倍
+        """
+        self.browsers = browsers
+        self.host = host
+        self.port = port
+        self.headless = headless
+        self.profile_dir = profile_dir
+        self.recycle_after = recycle_after
+        self.max_memory_growth = max_memory_growth_mb * 1024 * 1024
+        self.rate_limiter = HostRateLimiter(requests_per_minute)
+        self.target_count = target_count
+        self.prune_dom = prune_dom
+        self.freshness_cache = freshness_cache
+        self.max_finished_jobs = max_finished_jobs
+        self.restart_attempts = restart_attempts
+        self.restart_backoff = restart_backoff
+        
+        self.jobs = OrderedDict()
+        self._queue = queue.PriorityQueue()
+        self._seq = itertools.count()
+        self._lock = threading.Lock()
+        self._stopping = threading.Event()
+        self._latencies = deque(maxlen=200)
+        self._queue_waits = deque(maxlen=200)
+        self._slots = [
+            {'crawler': None, 'notes': 0, 'baseline_memory': None, 'job': None, 'state': 'starting', 'error': None}
+            for _ in range(browsers)
+        ]
+        self.recycled = 0
+        self.started_at = time.time()
+        # 服务运行期间所有任务的累计统计
+        self.stats = CommentStats()
+        self.server = None
+    
+    @staticmethod
+    def validate_job(payload):
+        """
+        校验提交的任务参数，返回 (url, target_count, priority)，参数无效时抛出ValueError
+        """
+        if not isinstance(payload, dict):
+            raise ValueError("请求体必须是JSON对象")
+        url = payload.get('url')
+        if not isinstance(url, str) or not url.strip():
+            raise ValueError("url必须是非空字符串")
+        target_count = payload.get('target_count')
+        if target_count is not None and (type(target_count) is not int or target_count <= 0):
+            raise ValueError("target_count必须是正整数")
+        priority = payload.get('priority', 0)
+        if type(priority) is not int:
+            raise ValueError("priority必须是整数")
+        return url.strip(), target_count, priority
+    
+    def submit(self, url, target_count=None, priority=0):
+        """
+        提交爬取任务，返回任务信息
+        """
+        url, target_count, priority = self.validate_job({'url': url, 'target_count': target_count, 'priority': priority})
+        note_id, url = normalize_note_url(url)
+        job = {
+            'id': f"{int(time.time() * 1000):x}{next(self._seq):04x}",
+            'url': url,
+            'note_id': note_id,
+            'target_count': target_count or self.target_count,
+            'priority': priority,
+            'status': 'queued',
+            'submitted_at': time.time(),
+            'started_at': None,
+            'finished_at': None,
+            'count': 0,
+            'error': None,
+            'comments': None,
+            'crawler': None,
+            'stats': None
+        }
+        # 持有锁时入队再登记任务，工作线程查找任务前需要获取同一把锁
+        with self._lock:
+            if not self.has_browsers():
+                raise RuntimeError("没有可用的浏览器")
+            self._queue.put((priority, next(self._seq), job['id']))
+            self.jobs[job['id']] = job
+            self._evict_finished_jobs()
+        return job
+    
+    def has_browsers(self):
+        """
+        是否还有可用（或正在重启）的浏览器
+        """
+        return any(slot['state'] != 'dead' for slot in self._slots)
+    
+    def _fail_queued_jobs(self, error):
+        """
+        没有可用的浏览器时，将排队中的任务全部标记为失败
+        """
+        while True:
+            try:
+                _, _, job_id = self._queue.get_nowait()
+            except queue.Empty:
+                return
+            with self._lock:
+                job = self.jobs.get(job_id)
+            if job is not None:
+                job.update(status='failed', error=error, comments=[], finished_at=time.time())
+    
+    def _evict_finished_jobs(self):
+        finished = [job_id for job_id, job in self.jobs.items() if job['status'] in ('done', 'empty', 'failed')]
+        for job_id in finished[:max(0, len(finished) - self.max_finished_jobs)]:
+            del self.jobs[job_id]
+    
+    def job_info(self, job):
+        """
+        任务状态（不含评论内容）
+        """
+        info = {key: value for key, value in job.items() if key not in ('comments', 'crawler')}
+        if job['status'] == 'running' and job['crawler'] is not None:
+            info['count'] = len(job['crawler'].comments_data)
+            info['stats'] = job['crawler'].stats.snapshot()
+        return info
+    
+    def metrics(self):
+        """
+        服务指标：队列长度、任务数量、任务耗时、浏览器重启次数
+        """
+        def percentile(values, p):
+            if not values:
+                return None
+            values = sorted(values)
+            return round(values[min(len(values) - 1, int(len(values) * p))], 2)
+        
+        with self._lock:
+            statuses = Counter(job['status'] for job in self.jobs.values())
+            latencies = list(self._latencies)
+            queue_waits = list(self._queue_waits)
+        
+        return {
+            'queue_depth': self._queue.qsize(),
+            'jobs': dict(statuses),
+            'latency_p50': percentile(latencies, 0.5),
+            'latency_p95': percentile(latencies, 0.95),
+            'queue_wait_p50': percentile(queue_waits, 0.5),
+            'queue_wait_p95': percentile(queue_waits, 0.95),
+            'browsers': [
+                {'notes': slot['notes'], 'busy': slot['job'] is not None, 'state': slot['state'], 'error': slot['error']}
+                for slot in self._slots
+            ],
+            'dead_browsers': sum(1 for slot in self._slots if slot['state'] == 'dead'),
+            'recycled': self.recycled,
+            'comments': self.stats.snapshot(5),
+            'uptime': round(time.time() - self.started_at, 1)
+        }
+    
+    def _start_crawler(self, index, interactive):
+        """
+        启动浏览器并打开首页完成登录检查
+        """
+        slot = self._slots[index]
+        profile = os.path.join(self.profile_dir, f"browser-{index}") if self.profile_dir else None
+        crawler = XiaohongshuSeleniumCrawler(
+            headless=self.headless, prune_dom=self.prune_dom, interactive=interactive,
+            freshness_cache=self.freshness_cache, profile_dir=profile
+        )
+        crawler.batch_stats = self.stats
+        try:
+            crawler.driver.get(self.HOME_URL)
+            crawler.wait_for_page_load()
+            crawler.login_check_and_wait()
+        except BaseException:
+            # 登录检查失败或被中断时关闭已启动的浏览器
+            crawler.close()
+            raise
+        # 登录完成后的爬取过程不再等待用户操作
+        crawler.interactive = False
+        
+        slot['baseline_memory'] = self.browser_memory(crawler)
+        if slot['baseline_memory'] is None:
+            print("⚠️  无法读取浏览器进程内存（需要安装psutil），只按笔记数量重启浏览器")
+        slot.update(crawler=crawler, notes=0, state='ready', error=None)
+        print(f"浏览器 {index} 已就绪")
+    
+    @staticmethod
+    def browser_memory(crawler):
+        """
+        统计浏览器驱动进程及其全部子进程（浏览器、渲染进程等）的常驻内存
+        每次打开笔记都会重建页面的JS堆，只有进程内存能反映跨笔记的泄漏
+        :return: 字节数，未安装psutil或无法获取进程时返回None
+        """
+        try:
+            import psutil
+        except ImportError:
+            return None
+        
+        try:
+            root = psutil.Process(crawler.driver.service.process.pid)
+            processes = [root] + root.children(recursive=True)
+        except Exception:
+            return None
+        
+        total = 0
+        for process in processes:
+            try:
+                total += process.memory_info().rss
+            except psutil.Error:
+                continue
+        return total
+    
+    def _needs_recycle(self, slot):
+        if slot['notes'] >= self.recycle_after:
+            return True
+        if slot['baseline_memory'] is None:
+            return False
+        memory = self.browser_memory(slot['crawler'])
+        if memory is None:
+            # 驱动进程已退出，浏览器需要重启
+            return True
+        growth = memory - slot['baseline_memory']
+        if growth > self.max_memory_growth:
+            print(f"浏览器内存比启动时增加 {growth / 1024 / 1024:.0f} MB，准备重启")
+            return True
+        return False
+    
+    def _recycle(self, index):
+        """
+        关闭并重新启动浏览器，失败时按指数退避重试
+        :return: 是否重启成功，重试次数用完后浏览器标记为不可用
+        """
+        slot = self._slots[index]
+        print(f"重启浏览器 {index}（已爬取 {slot['notes']} 篇笔记）")
+        if slot['crawler'] is not None:
+            try:
+                slot['crawler'].close()
+            except Exception as e:
+                print(f"关闭浏览器出错: {e}")
+        slot.update(crawler=None, state='restarting')
+        self.recycled += 1
+        
+        delay = self.restart_backoff
+        for attempt in range(self.restart_attempts):
+            try:
+                self._start_crawler(index, interactive=False)
+                return True
+            except Exception as e:
+                slot['error'] = str(e)
+                print(f"浏览器 {index} 第{attempt + 1}次重启失败: {e}")
+            if attempt < self.restart_attempts - 1 and self._stopping.wait(delay):
+                break
+            delay *= 2
+        
+        # 与submit使用同一把锁，标记之后提交的任务会被直接拒绝
+        with self._lock:
+            slot['state'] = 'dead'
+            no_browsers = not self.has_browsers()
+        print(f"❌ 浏览器 {index} 已不可用")
+        if no_browsers:
+            print("❌ 没有可用的浏览器，排队中的任务将被标记为失败")
+            self._fail_queued_jobs("没有可用的浏览器")
+        return False
+    
+    def _worker(self, index):
+        """
+        浏览器工作线程：依次领取任务并爬取
+        """
+        slot = self._slots[index]
+        while not self._stopping.is_set():
+            try:
+                _, _, job_id = self._queue.get(timeout=1)
+            except queue.Empty:
+                continue
+            
+            with self._lock:
+                job = self.jobs.get(job_id)
+            if job is None:
+                continue
+            
+            crawler = slot['crawler']
+            slot['job'] = job_id
+            try:
+                self.rate_limiter.wait(job['url'])
+                crawler.reset_comments()
+                job.update(status='running', started_at=time.time(), crawler=crawler)
+                comments = crawler.get_comments(job['url'], job['target_count'])
+                job.update(
+                    status='done' if comments else 'empty',
+                    comments=comments,
+                    count=len(comments),
+                    stats=crawler.stats.snapshot()
+                )
+                if crawler.last_cache_entry is not None:
+                    job['fresh'] = True
+            except Exception as e:
+                print(f"任务 {job_id} 出错: {e}")
+                job.update(status='failed', error=str(e), comments=list(crawler.comments_data))
+            finally:
+                job['finished_at'] = time.time()
+                job['crawler'] = None
+                slot['job'] = None
+                slot['notes'] += 1
+                with self._lock:
+                    self._latencies.append(job['finished_at'] - job['submitted_at'])
+                    self._queue_waits.append(job['started_at'] - job['submitted_at'] if job['started_at'] else 0)
+            
+            if self._needs_recycle(slot) and not self._recycle(index):
+                return
+    
+    def _make_handler(self):
+        from http.server import BaseHTTPRequestHandler
+        
+        daemon = self
+        
+        class Handler(BaseHTTPRequestHandler):
+            def _send_json(self, data, status=200):
+                body = json.dumps(data, ensure_ascii=False).encode('utf-8')
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json; charset=utf-8')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+            
+            def _get_job(self, job_id):
+                with daemon._lock:
+                    return daemon.jobs.get(job_id)
+            
+            def do_POST(self):
+                if self.path.rstrip('/') != '/jobs':
+                    return self._send_json({'error': 'not found'}, 404)
+                try:
+                    length = int(self.headers.get('Content-Length') or 0)
+                    payload = json.loads(self.rfile.read(length) or b'{}')
+                    url, target_count, priority = daemon.validate_job(payload)
+                    job = daemon.submit(url, target_count, priority)
+                except ValueError as e:
+                    return self._send_json({'error': f"无效的任务: {e}"}, 400)
+                except RuntimeError as e:
+                    return self._send_json({'error': str(e)}, 503)
+                self._send_json(daemon.job_info(job), 202)
+            
+            def do_GET(self):
+                parts = [part for part in urlparse(self.path).path.split('/') if part]
+                if parts == ['metrics']:
+                    return self._send_json(daemon.metrics())
+                if parts == ['jobs']:
+                    with daemon._lock:
+                        jobs = list(daemon.jobs.values())
+                    return self._send_json([daemon.job_info(job) for job in jobs])
+                if len(parts) >= 2 and parts[0] == 'jobs':
+                    job = self._get_job(parts[1])
+                    if job is None:
+                        return self._send_json({'error': 'job not found'}, 404)
+                    if len(parts) == 2:
+                        return self._send_json(daemon.job_info(job))
+                    if parts[2:] == ['results']:
+                        return self._stream_results(job)
+                self._send_json({'error': 'not found'}, 404)
+            
+            def _stream_results(self, job):
+                """
+                以JSONL格式流式返回评论，任务进行中时持续输出新采集的评论直到任务结束
+                """
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/x-ndjson; charset=utf-8')
+                self.end_headers()
+                sent = 0
+                while True:
+                    finished = job['finished_at'] is not None
+                    crawler = job['crawler']
+                    if finished:
+                        comments = job['comments'] or []
+                    elif crawler is not None:
+                        comments = crawler.comments_data
+                    else:
+                        comments = []
+                    
+                    for comment in comments[sent:]:
+                        self.wfile.write((json.dumps(comment, ensure_ascii=False) + "\n").encode('utf-8'))
+                    sent = max(sent, len(comments))
+                    self.wfile.flush()
+                    if finished:
+                        return
+                    time.sleep(0.5)
+            
+            def log_message(self, format, *args):
+                pass
+        
+        return Handler
+    
+    def serve_forever(self):
+        """
+        启动浏览器和HTTP服务，直到按Ctrl+C退出
+        """
+        from http.server import ThreadingHTTPServer
+        
+        workers = []
+        try:
+            # 逐个启动浏览器，首次启动时可以在控制台提示下完成登录
+            for index in range(self.browsers):
+                self._start_crawler(index, interactive=True)
+            
+            workers = [threading.Thread(target=self._worker, args=(index,), daemon=True) for index in range(self.browsers)]
+            for worker in workers:
+                worker.start()
+            
+            self.server = ThreadingHTTPServer((self.host, self.port), self._make_handler())
+            print(f"爬取服务已启动: http://{self.host}:{self.port}")
+            print("POST /jobs 提交任务，GET /jobs/<id> 查询状态，GET /jobs/<id>/results 获取结果，GET /metrics 查看指标")
+            self.server.serve_forever()
+        except KeyboardInterrupt:
+            print("\n正在停止服务...")
+        finally:
+            self._stopping.set()
+            if self.server is not None:
+                self.server.server_close()
+            for worker in workers:
+                worker.join(timeout=5)
+            for slot in self._slots:
+                if slot['crawler']:
+                    slot['crawler'].close()
+
+class CommentWriter:
+    """
+    按扩展名写出评论：.jsonl 和 .csv 逐条流式写入，.xlsx 在关闭时一次性保存
+    """
+    def __init__(self, filename):
+        self.filename = filename
+        self.count = 0
+        self._buffer = []
+        self._file = None
+        self._csv = None
+        
+        ext = os.path.splitext(filename)[1].lower()
+        self.format = ext.lstrip('.') if ext in ('.jsonl', '.csv', '.xlsx') else 'jsonl'
+        if self.format == 'jsonl':
+            self._file = open(filename, 'w', encoding='utf-8')
+        elif self.format == 'csv':
+            self._file = open(filename, 'w', encoding='utf-8-sig', newline='')
+            self._csv = csv.DictWriter(self._file, fieldnames=XiaohongshuSeleniumCrawler.COLUMNS, extrasaction='ignore')
+            self._csv.writeheader()
+    
+    def write(self, comments):
+        """
+        写出一批评论
+        """
+        for comment in comments:
+            if self.format == 'jsonl':
+                self._file.write(json.dumps(comment, ensure_ascii=False) + "\n")
+            elif self.format == 'csv':
+                self._csv.writerow(comment)
+            else:
+                self._buffer.append(comment)
+        if self._file:
+            self._file.flush()
+        self.count += len(comments)
+    
+    def close(self):
+        if self._file:
+            self._file.close()
+        elif self._buffer:
+            XiaohongshuSeleniumCrawler(start_browser=False).save_to_excel(self.filename, self._buffer)
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, *exc_info):
+        self.close()
+
+def iter_comments(filename):
+    """
+    逐条读取导出的评论文件（.jsonl / .csv / .xlsx）
+    """
+    ext = os.path.splitext(filename)[1].lower()
+    if ext == '.xlsx':
+        import pandas as pd
+        
+        yield from pd.read_excel(filename).fillna('').to_dict('records')
+        return
+    
+    with open(filename, 'r', encoding='utf-8-sig', newline='') as f:
+        if ext == '.csv':
+            yield from csv.DictReader(f)
+        else:
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+
+def convert_comments(input_file, output_file, batch_size=1000):
+    """
+    在不同的导出格式之间转换评论文件，不需要启动浏览器
+    :return: 转换的评论数量
+    """
+    with CommentWriter(output_file) as writer:
+        batch = []
+        for comment in iter_comments(input_file):
+            batch.append(comment)
+            if len(batch) >= batch_size:
+                writer.write(batch)
+                batch = []
+        writer.write(batch)
+    
+    print(f"✅ 已将 {writer.count} 条评论从 {input_file} 转换到 {output_file}")
+    return writer.count
+
+class SnapshotHTMLParser(HTMLParser):
+    """
+    从保存的页面HTML中收集评论节点的文本，结构与PRUNE_SCRIPT采集的结果一致
+    """
+    VOID_TAGS = {'area', 'base', 'br', 'col', 'embed', 'hr', 'img', 'input', 'link', 'meta', 'source', 'track', 'wbr'}
+    BLOCK_TAGS = {'div', 'p', 'li', 'ul', 'section', 'br'}
+    
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.items = []
+        self._stack = []
+        self._skip_depth = 0
+        self._last_parent_id = ''
+    
+    def handle_starttag(self, tag, attrs):
+        attrs = dict(attrs)
+        if tag in self.BLOCK_TAGS:
+            self._append_text("\n")
+        if tag in self.VOID_TAGS:
+            return
+        
+        classes = attrs.get('class') or ''
+        frame = {'tag': tag, 'item': None, 'reply': 'reply-container' in classes or 'sub-comment' in classes}
+        if tag in ('script', 'style'):
+            self._skip_depth += 1
+        elif 'comment-item' in classes:
+            comment_id = (attrs.get('id') or '').replace('comment-', '', 1)
+            in_reply = any(f['reply'] for f in self._stack)
+            if not in_reply:
+                self._last_parent_id = comment_id
+            frame['item'] = {
+                'id': comment_id,
+                'text': [],
+                'level': 2 if in_reply else 1,
+                'parent_id': self._last_parent_id if in_reply else ''
+            }
+            self.items.append(frame['item'])
+        self._stack.append(frame)
+    
+    def handle_endtag(self, tag):
+        if tag in self.BLOCK_TAGS:
+            self._append_text("\n")
+        # 容错处理未闭合的标签
+        for i in range(len(self._stack) - 1, -1, -1):
+            if self._stack[i]['tag'] == tag:
+                for frame in self._stack[i:]:
+                    if frame['tag'] in ('script', 'style'):
+                        self._skip_depth -= 1
+                del self._stack[i:]
+                return
+    
+    def handle_data(self, data):
+        if not self._skip_depth:
+            self._append_text(data)
+    
+    def _append_text(self, text):
+        for frame in self._stack:
+            if frame['item'] is not None:
+                frame['item']['text'].append(text)
+    
+    def get_items(self):
+        """
+        返回采集到的评论节点 {id, text, level, parent_id}
+        """
+        items = []
+        for item in self.items:
+            lines = (re.sub(r'[ \t\r\f\v]+', ' ', line).strip() for line in ''.join(item['text']).split("\n"))
+            items.append(dict(item, text="\n".join(line for line in lines if line)))
+        return items
+
+_snapshot_parser = None
+
+def snapshot_state_path(path):
+    """
+    返回与页面快照同名的状态JSON路径，不存在时返回None
+    """
+    state_path = os.path.splitext(path)[0] + ".json"
+    return state_path if os.path.exists(state_path) else None
+
+def parse_snapshot_file(path):
+    """
+    解析单个页面快照（.html）或页面状态文件（.json）中的评论
+    页面快照旁有同名的状态JSON（save_snapshot保存）时，使用其中的状态数据代替页面内嵌的状态
+    """
+    global _snapshot_parser
+    if _snapshot_parser is None:
+        _snapshot_parser = XiaohongshuSeleniumCrawler(start_browser=False)
+    crawler = _snapshot_parser
+    
+    with open(path, 'r', encoding='utf-8', errors='ignore') as f:
+        text = f.read()
+    
+    comments = []
+    if path.lower().endswith('.json'):
+        comments = crawler.parse_comments_from_js_data(json.loads(text))
+    else:
+        # 状态数据优先，DOM中只补充状态数据里没有的评论
+        state_comments = []
+        state_path = snapshot_state_path(path)
+        match = re.search(r'window\.__INITIAL_STATE__\s*=\s*(.*?)\s*;?\s*</script>', text, re.S)
+        if state_path:
+            with open(state_path, 'r', encoding='utf-8', errors='ignore') as f:
+                state_comments = crawler.parse_comments_from_js_data(json.loads(f.read()))
+        elif match:
+            try:
+                state = json.loads(re.sub(r'\bundefined\b', 'null', match.group(1)))
+                state_comments = crawler.parse_comments_from_js_data(state)
+            except ValueError:
+                pass
+        
+        html_parser = SnapshotHTMLParser()
+        html_parser.feed(text)
+        html_parser.close()
+        state_comments, dom_comments = crawler.reconcile_comments(state_comments, html_parser.get_items())
+        comments = state_comments + dom_comments
+    
+    for comment in comments:
+        comment['source_file'] = os.path.basename(path)
+    return comments
+
+def _parse_snapshot_chunk(paths):
+    """
+    在子进程中解析一组快照文件
+    """
+    results = []
+    for path in paths:
+        try:
+            results.append((path, parse_snapshot_file(path), None))
+        except Exception as e:
+            results.append((path, [], str(e)))
+    return results
+
+def reparse_snapshots(input_dir, output, workers=None, chunk_size=8):
+    """
+    使用进程池批量重新解析快照目录中的页面快照和状态JSON，结果边解析边写出
+    :param input_dir: 快照目录（递归查找 .html / .htm / .json 文件，与页面快照同名的 .json 随页面一起解析）
+    :param output: 输出文件，支持 .jsonl / .csv / .xlsx
+    :param workers: 进程数，默认为CPU核数
+    :param chunk_size: 每个任务包含的文件数，文件较小时适当调大可减少进程间通信
+    :return: 解析出的评论总数
+    """
+    from concurrent.futures import ProcessPoolExecutor, as_completed
+    
+    paths = []
+    for root, _, files in os.walk(input_dir):
+        # 与页面快照同名的状态JSON随页面快照一起解析，不单独解析
+        pages = {os.path.splitext(name)[0] for name in files if name.lower().endswith(('.html', '.htm'))}
+        for name in sorted(files):
+            base, ext = os.path.splitext(name)
+            if ext.lower() in ('.html', '.htm') or (ext.lower() == '.json' and base not in pages):
+                paths.append(os.path.join(root, name))
+    
+    if not paths:
+        print(f"在 {input_dir} 中没有找到快照文件")
+        return 0
+    
+    chunks = [paths[i:i + chunk_size] for i in range(0, len(paths), chunk_size)]
+    print(f"共 {len(paths)} 个快照文件，分为 {len(chunks)} 个任务")
+    
+    started = time.time()
+    done_files = 0
+    with CommentWriter(output) as writer, ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = [executor.submit(_parse_snapshot_chunk, chunk) for chunk in chunks]
+        for future in as_completed(futures):
+            for path, comments, error in future.result():
+                done_files += 1
+                if error:
+                    print(f"解析 {path} 出错: {error}")
+                    continue
+                writer.write(comments)
+            print(f"已解析 {done_files}/{len(paths)} 个文件，共 {writer.count} 条评论")
+    
+    print(f"✅ 解析完成，用时 {time.time() - started:.1f} 秒，共 {writer.count} 条评论，已保存到 {output}")
+    return writer.count
+
+def main():
+    """
+    主函数
+    """
+    print("=== 小红书评论爬虫 (Selenium + Edge版本) ===")
+    print("此版本使用Microsoft Edge浏览器自动化技术，可以更好地应对反爬虫措施")
+    
+    # 输入参数
+    url = input("请输入小红书笔记URL: ").strip()
+    
+    # 询问是否使用无头模式
+    headless_choice = input("是否使用无头模式？(y/n，建议选择n以便观察和手动登录): ").strip().lower()
+    headless = headless_choice == 'y'
+    
+    # 评论很多时可裁剪已采集的评论节点，避免页面越滚越慢
+    prune_choice = input("是否在滚动时裁剪已采集的评论节点？(y/n，评论较多时建议选择y): ").strip().lower()
+    prune_dom = prune_choice == 'y'
+    
+    # 目标评论数量
+    try:
+        target_count = int(input("请输入目标评论数量 (默认1083): ").strip() or "1083")
+    except ValueError:
+        target_count = 1083
+    
+    crawler = None
+    try:
+        # 初始化爬虫
+        crawler = XiaohongshuSeleniumCrawler(headless=headless, prune_dom=prune_dom)
+        
+        # 获取评论
+        print(f"\n开始爬取评论，目标数量: {target_count}")
+        comments = crawler.get_comments(url, target_count)
+        
+        if comments:
+            # 保存到Excel
+            note_id = crawler.extract_note_id(url)
+            filename = f"xiaohongshu_comments_{note_id}_{int(time.time())}.xlsx"
+            crawler.save_to_excel(filename)
+            print(f"\n✅ 爬取完成！共获取 {len(comments)} 条评论")
+        else:
+            print("\n❌ 未获取到评论数据")
+            
+    except Exception as e:
+        print(f"程序执行出错: {str(e)}")
+    finally:
+        if crawler:
+            input("\n按Enter键关闭浏览器...")
+            crawler.close()
+
+def run_cli(argv):
+    """
+    命令行子命令入口
+    """
+    parser = argparse.ArgumentParser(prog="xhscomment.py", description="小红书评论爬虫")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    
+    reparse_parser = subparsers.add_parser("reparse", help="使用多进程重新解析保存的页面快照或状态JSON")
+    reparse_parser.add_argument("input_dir", help="快照目录")
+    reparse_parser.add_argument("-o", "--output", default="xiaohongshu_comments_reparsed.jsonl",
+                                help="输出文件，支持 .jsonl / .csv / .xlsx")
+    reparse_parser.add_argument("-j", "--workers", type=int, default=None, help="进程数，默认为CPU核数")
+    reparse_parser.add_argument("--chunk-size", type=int, default=8, help="每个任务包含的文件数")
+    
+    convert_parser = subparsers.add_parser("convert", help="转换导出文件格式（.jsonl / .csv / .xlsx）")
+    convert_parser.add_argument("input_file", help="输入文件")
+    convert_parser.add_argument("output_file", help="输出文件")
+    
+    record_parser = subparsers.add_parser("record", help="爬取一篇笔记并录制WebDriver会话")
+    record_parser.add_argument("url", help="笔记URL")
+    record_parser.add_argument("-o", "--output", default="xhs_session.jsonl", help="录制文件")
+    record_parser.add_argument("-n", "--target-count", type=int, default=1083, help="目标评论数量")
+    record_parser.add_argument("--headless", action="store_true", help="使用无头模式")
+    record_parser.add_argument("--prune-dom", action="store_true", help="滚动时裁剪已采集的评论节点")
+    
+    replay_parser = subparsers.add_parser("replay", help="离线回放录制的会话并统计耗时和调用次数")
+    replay_parser.add_argument("log", help="录制文件")
+    replay_parser.add_argument("-r", "--repeat", type=int, default=3, help="回放次数")
+    replay_parser.add_argument("--strict", action="store_true", help="要求命令顺序与录制完全一致")
+    
+    daemon_parser = subparsers.add_parser("daemon", help="启动常驻爬取服务，通过本地HTTP接口提交任务")
+    daemon_parser.add_argument("--host", default="127.0.0.1", help="监听地址")
+    daemon_parser.add_argument("--port", type=int, default=8765, help="监听端口")
+    daemon_parser.add_argument("-b", "--browsers", type=int, default=2, help="常驻浏览器数量")
+    daemon_parser.add_argument("--headless", action="store_true", help="使用无头模式（需已在用户数据目录中登录）")
+    daemon_parser.add_argument("--profile-dir", default="xhs_profiles", help="浏览器用户数据目录")
+    daemon_parser.add_argument("--recycle-after", type=int, default=20, help="每个浏览器爬取多少篇笔记后重启")
+    daemon_parser.add_argument("--max-memory-growth", type=int, default=512,
+                               help="浏览器进程内存增长超过多少MB后重启浏览器（需要安装psutil）")
+    daemon_parser.add_argument("--rpm", type=int, default=6, help="每分钟最多打开的笔记页面数")
+    daemon_parser.add_argument("--cache-ttl", type=int, default=3600, help="最近爬取过的笔记在多少秒内不再重复爬取，0为不缓存")
+    
+    enqueue_parser = subparsers.add_parser("enqueue", help="向共享任务队列添加笔记")
+    enqueue_parser.add_argument("queue", help="任务队列SQLite文件路径（可位于共享目录）")
+    enqueue_parser.add_argument("urls", nargs="*", help="笔记URL")
+    enqueue_parser.add_argument("-f", "--file", help="每行一个笔记URL的文本文件")
+    enqueue_parser.add_argument("-p", "--priority", type=int, default=0, help="优先级，数值越小越先爬取")
+    enqueue_parser.add_argument("-n", "--target-count", type=int, default=1083, help="目标评论数量")
+    enqueue_parser.add_argument("--max-attempts", type=int, default=3, help="最大尝试次数")
+    
+    worker_parser = subparsers.add_parser("worker", help="从共享任务队列领取笔记并爬取")
+    worker_parser.add_argument("queue", help="任务队列SQLite文件路径")
+    worker_parser.add_argument("-o", "--output-dir", default=".", help="结果保存目录")
+    worker_parser.add_argument("--worker-id", default=None, help="工作节点标识，默认为 主机名-进程号")
+    worker_parser.add_argument("--headless", action="store_true", help="使用无头模式（需已在用户数据目录中登录）")
+    worker_parser.add_argument("--profile-dir", default=None, help="浏览器用户数据目录，用于保留登录状态")
+    worker_parser.add_argument("--rpm", type=int, default=6, help="每分钟最多打开的笔记页面数")
+    worker_parser.add_argument("--lease", type=int, default=600, help="任务租约时长（秒）")
+    
+    batch_parser = subparsers.add_parser("batch", help="使用多个浏览器批量爬取多篇笔记")
+    batch_parser.add_argument("urls", nargs="*", help="笔记URL")
+    batch_parser.add_argument("-f", "--file", help="每行一个笔记URL的文本文件")
+    batch_parser.add_argument("-b", "--browsers", type=int, default=1, help="同时运行的浏览器数量")
+    batch_parser.add_argument("-o", "--output-dir", default=".", help="结果保存目录")
+    batch_parser.add_argument("-n", "--target-count", type=int, default=1083, help="目标评论数量")
+    batch_parser.add_argument("--headless", action="store_true", help="使用无头模式（需已在用户数据目录中登录）")
+    batch_parser.add_argument("--profile-dir", default=None, help="浏览器用户数据目录，用于保留登录状态")
+    batch_parser.add_argument("--rpm", type=int, default=6, help="每分钟最多打开的笔记页面数")
+    batch_parser.add_argument("--prune-dom", action="store_true", help="滚动时裁剪已采集的评论节点")
+    batch_parser.add_argument("--cache-ttl", type=int, default=3600, help="最近爬取过的笔记在多少秒内不再重复爬取，0为不缓存")
+    
+    # reparse / convert 只做解析和导出，不会加载selenium
+    args = parser.parse_args(argv)
+    if args.command == "reparse":
+        reparse_snapshots(args.input_dir, args.output, workers=args.workers, chunk_size=args.chunk_size)
+    elif args.command == "convert":
+        convert_comments(args.input_file, args.output_file)
+    elif args.command == "record":
+        crawler = XiaohongshuSeleniumCrawler(headless=args.headless, prune_dom=args.prune_dom)
+        try:
+            record_session(crawler, args.url, args.output, args.target_count)
+        finally:
+            crawler.close()
+    elif args.command == "replay":
+        results = replay_session(args.log, repeat=args.repeat, strict=args.strict)
+        if not all(result['valid'] for result in results):
+            sys.exit(1)
+    elif args.command == "batch":
+        urls = list(args.urls)
+        if args.file:
+            with open(args.file, 'r', encoding='utf-8') as f:
+                urls.extend(line.strip() for line in f if line.strip())
+        results = crawl_batch(
+            urls,
+            browsers=args.browsers,
+            headless=args.headless,
+            requests_per_minute=args.rpm,
+            output_dir=args.output_dir,
+            target_count=args.target_count,
+            prune_dom=args.prune_dom,
+            freshness_cache=FreshnessCache(ttl=args.cache_ttl) if args.cache_ttl > 0 else None,
+            profile_dir=args.profile_dir
+        )
+        for url, result in results.items():
+            print(f"{result['status']}\t{result.get('count', 0)}\t{result.get('file', '')}\t{url}")
+    elif args.command == "enqueue":
+        urls = list(args.urls)
+        if args.file:
+            with open(args.file, 'r', encoding='utf-8') as f:
+                urls.extend(line.strip() for line in f if line.strip())
+        job_queue = SQLiteJobQueue(args.queue)
+        added = 0
+        for url in urls:
+            _, url = normalize_note_url(url)
+            added += job_queue.add(url, args.priority, args.target_count, args.max_attempts)
+        print(f"新增 {added} 个任务（{len(urls) - added} 个已在队列中），队列状态: {job_queue.counts()}")
+    elif args.command == "worker":
+        crawler = XiaohongshuSeleniumCrawler(headless=args.headless, profile_dir=args.profile_dir)
+        try:
+            # 开始领取任务前完成登录，之后的爬取过程不再等待用户操作
+            crawler.driver.get(CrawlDaemon.HOME_URL)
+            crawler.wait_for_page_load()
+            crawler.login_check_and_wait()
+            crawler.interactive = False
+            run_queue_worker(
+                SQLiteJobQueue(args.queue),
+                crawler,
+                worker_id=args.worker_id,
+                output_dir=args.output_dir,
+                lease_seconds=args.lease,
+                rate_limiter=HostRateLimiter(args.rpm)
+            )
+        finally:
             crawler.close()
+    elif args.command == "daemon":
+        CrawlDaemon(
+            browsers=args.browsers,
+            host=args.host,
+            port=args.port,
+            headless=args.headless,
+            profile_dir=args.profile_dir,
+            recycle_after=args.recycle_after,
+            max_memory_growth_mb=args.max_memory_growth,
+            requests_per_minute=args.rpm,
+            freshness_cache=FreshnessCache(ttl=args.cache_ttl) if args.cache_ttl > 0 else None
+        ).serve_forever()
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    if len(sys.argv) > 1:
+        run_cli(sys.argv[1:])
+    else:
+        main()
\ No newline at end of file